@@ -0,0 +1,46 @@
+# coding=utf8
+
+"""
+  Helpers shared by the benchmarks: the tree benchmarked, the todos
+generated and the memory measured.
+
+  The tree's root is put first on sys.path, so the benchmarks import the
+todo package they sit beside, not an installed one.
+"""
+
+import os
+import sys
+import resource
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, root)
+
+# a todo command, as `todo` runs it: python -c script args..
+script = "from todo.server import main; main()"
+
+
+def todo_lines(size, content=None):
+    """
+      yield the lines of a generated todo of `size` tasks, every third one
+    done, each but the first starting with its newline. A task's content is
+    content(index), by default 'Task number <index>, go shopping'.
+    """
+    yield "Benchmark\n---------"
+    for index in xrange(size):
+        done = "[x]" if index % 3 == 0 else "   "
+        if content is None:
+            yield "\n- %s Task number %d, go shopping" % (done, index)
+        else:
+            yield "\n- %s %s" % (done, content(index))
+
+
+def make_todo(path, size, content=None):
+    """write a todo.txt of `size` tasks to path, see todo_lines"""
+    with open(path, "w") as f:
+        f.writelines(todo_lines(size, content))
+
+
+def peak():
+    """max resident set size of this process, in KB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
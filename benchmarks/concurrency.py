@@ -0,0 +1,128 @@
+# coding=utf8
+
+"""
+  Concurrency stress test, many todo commands on one todo.txt at once.
+
+  Starts dozens of worker processes together: adders add tasks, checkers
+check the tasks of a seeded todo done, and renamers rename the todo, which
+is journaled, so adds and checks compact the journal too. Each operation
+runs as a `todo` command would, with a fresh App. Then verifies no update
+was lost: every task added is there once, every seeded task is done.
+Reports the throughput::
+
+      python benchmarks/concurrency.py --adders 24 --checkers 12 --ops 50
+
+  With --unlocked, todo.txt's lock is disabled, to see the updates lost
+without it.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+import common  # puts the tree benchmarked first on sys.path
+
+
+def command(args):
+    """run a todo command in process"""
+    from todo import app
+    sys.argv = ["todo"] + args
+    app.App().run()
+
+
+def worker(start, unlocked, commands):
+    """wait for the start, then run the commands, each as a todo run"""
+    from todo import app
+    if unlocked:
+        app.fcntl = None
+    start.wait()
+    for args in commands:
+        command(args)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--adders", type=int, default=24)
+    argparser.add_argument("--checkers", type=int, default=12)
+    argparser.add_argument("--renamers", type=int, default=2)
+    argparser.add_argument("--ops", type=int, default=50,
+                           help="operations per worker")
+    argparser.add_argument("--unlocked", action="store_true")
+    opts = argparser.parse_args()
+
+    home = tempfile.mkdtemp()
+    os.environ["HOME"] = home
+    os.chdir(home)
+
+    seeded = opts.checkers * opts.ops
+
+    with open(os.path.join(home, "todo.txt"), "w") as f:
+        f.write("Stress\n------")
+        for index in xrange(seeded):
+            f.write("\n-     seeded %d" % index)
+
+    workers = []
+    for adder in xrange(opts.adders):
+        workers.append([["adder-%d-%d" % (adder, op)]
+                        for op in xrange(opts.ops)])
+    for checker in xrange(opts.checkers):
+        workers.append([[str(id), "done"] for id in
+                        xrange(checker + 1, seeded + 1, opts.checkers)])
+    for renamer in xrange(opts.renamers):
+        workers.append([["name", "Stress-%d-%d" % (renamer, op)]
+                        for op in xrange(opts.ops)])
+
+    start = multiprocessing.Event()
+    processes = [multiprocessing.Process(target=worker,
+                                         args=(start, opts.unlocked, commands))
+                 for commands in workers]
+
+    try:
+        for process in processes:
+            process.start()
+        time.sleep(0.5)  # let the workers import
+
+        started = time.time()
+        start.set()
+        for process in processes:
+            process.join()
+        elapsed = time.time() - started
+
+        from todo import app
+        todo = app.App().todo
+        contents = [task.content for task in todo.tasks]
+
+        added = set(content for content in contents
+                    if content.startswith("adder-"))
+        lost_adds = len(workers[0]) * opts.adders - len(added)
+        duplicates = sum(1 for content in contents
+                         if content.startswith("adder-")) - len(added)
+        lost_checks = sum(1 for task in todo.tasks
+                          if task.content.startswith("seeded") and
+                          not task.done)
+        seeded_left = sum(1 for content in contents
+                          if content.startswith("seeded"))
+
+        ops = sum(len(commands) for commands in workers)
+        print "%d processes, %d operations in %.2f s, %.0f ops/s" % (
+            len(processes), ops, elapsed, ops / elapsed)
+        print "  adds lost %d, duplicated %d, checks lost %d, " \
+            "seeded tasks lost %d" % (lost_adds, duplicates, lost_checks,
+                                      seeded - seeded_left)
+        failed = (lost_adds or duplicates or lost_checks or
+                  seeded_left != seeded)
+    finally:
+        shutil.rmtree(home)
+
+    if failed:
+        print "FAILED, updates were lost"
+        sys.exit(1)
+    print "ok, no update lost"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,453 @@
+# coding=utf8
+
+"""
+  Stand-in gist API on localhost, to run the gist commands against.
+
+  Serves gists from memory as api.github.com does, as far as todo uses
+it: GET (with ETag and If-None-Match), PATCH and POST of /gists, files
+larger than `truncate` bytes truncated in the gist's response and served
+at their raw_url, over kept alive HTTP/1.1 connections. Every request and
+connection is logged. Latency and faults can be injected: a delay before
+each response, and the next requests answered with an error status,
+dropped, or delayed. `todo` talks to it with TODO_GITHUB_API set to its
+url.
+
+  Run as a script, it runs `todo pull`, `todo sync` and a first `todo push`
+scenarios against it, then checks the http client's connection reuse,
+timeouts and retries, and push's token retry, with injected faults::
+
+      python benchmarks/gist_api.py
+
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import hashlib
+import tempfile
+import threading
+import subprocess
+import SocketServer
+import BaseHTTPServer
+
+from common import root
+
+
+class GistAPI(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+      The stand-in api server, serving in a thread once started.
+
+      attributes
+        url         str     the api's root url
+        gists       dict    {gist_id: {file name: content}}
+        requests    list    (method, path, status) of the requests served,
+                            status None if dropped
+        connections int     the number of connections accepted
+        active      int     the number of requests being handled
+        truncate    int     size over which files are truncated
+        latency     float   seconds slept before each response
+        faults      list    faults of the next requests, one each: a status
+                            to answer, "drop" to close the connection
+                            without answering, or seconds to sleep first
+      methods
+        start       serve in a daemon thread
+    """
+
+    daemon_threads = True
+
+    def __init__(self, truncate=1 << 20, latency=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:%d" % self.server_port
+        self.gists = {}
+        self.requests = []
+        self.connections = 0
+        self.active = 0
+        self.truncate = truncate
+        self.latency = latency
+        self.faults = []
+        self.mutex = threading.Lock()
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def handle_error(self, request, client_address):
+        """ignore clients gone, timed out"""
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request,
+                                                   client_address)
+
+    def idle(self):
+        """wait for the requests being handled"""
+        while self.active:
+            time.sleep(0.01)
+
+    def gist(self, gist_id):
+        """the gist's json, as the api returns it"""
+        files = {}
+        for name, content in self.gists[gist_id].items():
+            truncated = len(content) > self.truncate
+            files[name] = {
+                "filename": name,
+                "size": len(content),
+                "truncated": truncated,
+                "content": content[:self.truncate],
+                "raw_url": "%s/raw/%s/%s" % (self.url, gist_id, name),
+            }
+        return json.dumps({"id": gist_id, "files": files,
+                           "html_url": "%s/%s" % (self.url, gist_id)},
+                          sort_keys=True)
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"  # keep connections alive
+    wbufsize = -1  # a response in one write, flushed
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.mutex:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_one_request(self):
+        """handle a request, or the fault injected for it"""
+        self.raw_requestline = self.rfile.readline(65537)
+        if not self.raw_requestline or not self.parse_request():
+            self.close_connection = 1
+            return
+
+        server = self.server
+        with server.mutex:
+            fault = server.faults.pop(0) if server.faults else None
+            server.active += 1
+        try:
+            self.handle_fault(fault)
+        finally:
+            with server.mutex:
+                server.active -= 1
+
+    def handle_fault(self, fault):
+        """handle the request read, with its fault"""
+        server = self.server
+        time.sleep(server.latency)
+        if isinstance(fault, float):
+            time.sleep(fault)
+            fault = None
+
+        if self.headers.get("Content-Length"):
+            data = self.rfile.read(int(self.headers["Content-Length"]))
+            self.data = json.loads(data)
+
+        if fault == "drop":
+            server.requests.append((self.command, self.path, None))
+            self.close_connection = 1
+        elif fault is not None:
+            self.respond(fault)
+        else:
+            getattr(self, "do_" + self.command)()
+        self.wfile.flush()
+
+    def respond(self, status, body="", headers={}):
+        self.server.requests.append((self.command, self.path, status))
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = self.path.split("/")[1:]
+        gists = self.server.gists
+
+        if parts[0] == "gists" and parts[1] in gists:
+            body = self.server.gist(parts[1])
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.respond(304, headers={"ETag": etag})
+            else:
+                self.respond(200, body, {"ETag": etag})
+        elif parts[0] == "raw" and parts[1] in gists:
+            content = gists[parts[1]].get(parts[2])
+            if content is None:
+                self.respond(404)
+            else:
+                self.respond(200, content.encode("utf8"))
+        else:
+            self.respond(404)
+
+    def do_PATCH(self):
+        parts = self.path.split("/")[1:]
+        if parts[0] == "gists" and parts[1] in self.server.gists:
+            for name, f in self.data["files"].items():
+                self.server.gists[parts[1]][name] = f["content"]
+            self.respond(200, self.server.gist(parts[1]))
+        else:
+            self.respond(404)
+
+    def do_POST(self):
+        if self.path == "/gists":
+            gist_id = "%x" % len(self.server.gists)
+            self.server.gists[gist_id] = dict(
+                (name, f["content"]) for name, f in self.data["files"].items())
+            self.respond(201, self.server.gist(gist_id))
+        else:
+            self.respond(404)
+
+
+def todo(home, api, *args, **kwargs):
+    """
+      run a todo command with HOME home against the api, answering its
+    prompts with `input`, check its exit status (`status`, 0 by default),
+    return its output.
+    """
+    env = dict(os.environ, HOME=home, PYTHONPATH=root,
+               TODO_GITHUB_API=api.url)
+    process = subprocess.Popen(
+        [sys.executable, "-c", "from todo.server import main; main()"] +
+        list(args), cwd=home, env=env, stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate(kwargs.get("input", ""))[0]
+    assert process.returncode == kwargs.get("status", 0), output
+    return output
+
+
+def check_sync(api, home, failures):
+    """
+      check `todo sync`: a request per gist changed, lists sharing a gist
+    pushed together, and a gist failing doesn't stop the others.
+    """
+    lists = {}
+    for name in ("Alpha", "Beta", "Gamma", "Solo", "Delta"):
+        path = os.path.join(home, "sync", name.lower(), "todo.txt")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write("%s\n%s\n-     task" % (name, "-" * len(name)))
+        lists[name] = path
+
+    with open(os.path.join(home, ".todo", "github_token"), "w") as f:
+        f.write("token")
+    with open(os.path.join(home, ".todo", "sync"), "w") as f:
+        f.write("# gists\n10 sync/[abg]*/todo.txt\n11 sync/solo/todo.txt Me\n")
+    api.gists["10"] = {}
+    api.gists["11"] = {}
+
+    def check(title, args, expected, status=0):
+        del api.requests[:]
+        start = time.time()
+        output = todo(home, api, "sync", *args, status=status)
+        elapsed = time.time() - start
+        made = sorted((method, path, status)
+                      for method, path, status in api.requests)
+        ok = made == sorted(expected)
+        print "%-32s %-40s %s %6.1f ms" % (
+            title, " ".join("%s %s %d" % request for request in made[:3]),
+            "ok" if ok else "FAILED", elapsed * 1000)
+        if not ok:
+            print output
+            failures.append(title)
+
+    check("sync push", ["push"], [("PATCH", "/gists/10", 200),
+                                  ("PATCH", "/gists/11", 200)])
+    if (sorted(api.gists["10"]) != ["Alpha", "Beta", "Gamma"] or
+            "Me" not in api.gists["11"]):
+        failures.append("sync push, gists' files")
+
+    check("sync push unchanged", ["push"], [])
+
+    with open(lists["Beta"], "a") as f:
+        f.write("\n-     more")
+    check("sync push one changed", ["push"], [("PATCH", "/gists/10", 200)])
+
+    api.gists["11"]["Me"] += u"\n- [x] remote"
+    check("sync pull", ["pull"], [("GET", "/gists/10", 200),
+                                  ("GET", "/gists/11", 200)])
+    if not open(lists["Solo"]).read().endswith("remote"):
+        failures.append("sync pull, list pulled")
+    check("sync pull unchanged", ["pull"], [("GET", "/gists/10", 304),
+                                            ("GET", "/gists/11", 304)])
+
+    with open(os.path.join(home, ".todo", "sync"), "a") as f:
+        f.write("ff sync/solo/../gamma/todo.txt\n12 sync/delta/todo.txt\n")
+    with open(lists["Alpha"], "a") as f:
+        f.write("\n-     more")
+    check("sync push, a gist missing", ["push"], [("PATCH", "/gists/10", 200),
+                                                 ("PATCH", "/gists/12", 404)],
+          status=1)
+
+
+def check_new_gist(api, failures):
+    """
+      check a first `todo push`, creating the gist: it's created with
+    todo.txt compacted, without the tasks removed in the journal.
+    """
+    home = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(home, ".todo"))
+        with open(os.path.join(home, ".todo", "github_token"), "w") as f:
+            f.write("token")
+        with open(os.path.join(home, "todo.txt"), "w") as f:
+            f.write("New\n---\n-     kept\n-     removed")
+        todo(home, api, "2", "remove")  # journaled
+        gists = set(api.gists)
+        todo(home, api, "push", input="1\n")
+        created = [api.gists[gist_id] for gist_id in set(api.gists) - gists]
+        ok = created == [{"New": u"New\n---\n-     kept"}]
+        print "%-32s %-40s %s" % ("new gist, task removed", created and
+                                  repr(created[0]["New"]), "ok" if ok else
+                                  "FAILED")
+        if not ok:
+            failures.append("new gist, task removed")
+    finally:
+        shutil.rmtree(home)
+
+
+def check_http(api, home, failures):
+    """
+      check the http client in process: connections are reused, failed
+    idempotent requests retried, not failed posts, and requests time out.
+    Then push's retry with a new token once the token is refused.
+    """
+    os.environ.update(HOME=home, TODO_GITHUB_API=api.url,
+                      TODO_HTTP_TIMEOUT="0.5,0.3")
+    os.chdir(home)
+    from todo import app
+    from todo import models
+
+    models.Github.backoff = 0.01
+    github = models.Github()
+    url = api.url + "/gists/0"
+
+    def check(title, faults, send, expected, connections=None):
+        """
+          inject faults, send requests, check the requests served, and
+        that at most `connections` connections were opened.
+        """
+        del api.requests[:]
+        api.faults[:] = faults
+        api.connections = 0
+        start = time.time()
+        try:
+            outcome = send()
+        except (Exception, SystemExit) as error:  # log.error exits
+            outcome = type(error).__name__
+        elapsed = time.time() - start
+        api.idle()
+        made = [status for method, path, status in api.requests]
+        ok = (made, outcome) == expected and (
+            connections is None or api.connections <= connections)
+        print "%-32s %-40s %s %6.1f ms" % (
+            title, "%s -> %s" % (" ".join(map(str, made[:6])), outcome),
+            "ok" if ok else "FAILED", elapsed * 1000)
+        if not ok:
+            failures.append(title)
+
+    def get(times=1):
+        for _ in xrange(times):
+            response = github.request("GET", url)
+        return response.status_code
+
+    def post():
+        return github.create_gist({"New": {"content": "New\n---"}}).status_code
+
+    def push():
+        app.GithubToken.get = lambda self: "token"  # never asked
+        sys.argv = ["todo", "push", "--force"]
+        app.App().run()
+
+    check("connection kept alive", [], lambda: get(20), ([200] * 20, 200), 1)
+    check("5xx retried", [503, 502], get, ([503, 502, 200], 200))
+    check("dropped connection retried", ["drop"], get, ([None, 200], 200))
+    check("5xx retries bounded", [503] * 4, get, ([503] * 4, 503))
+    check("read timeout", [1.0] * 4, get, ([200] * 4, "ReadTimeout"))
+    check("post not retried", [503], post, ([503], 503))
+    check("refused token, pushed again", [401], push, ([401, 200], None))
+    check("refused tokens, push fails", [401, 401], push,
+          ([401, 401], "SystemExit"))
+
+    api.latency = 0.05
+    check("50 ms latency", [], lambda: get(10), ([200] * 10, 200), 1)
+    api.latency = 0
+
+    models.Github._session.close()
+
+
+def main():
+    api = GistAPI(truncate=4096).start()
+    home = tempfile.mkdtemp()
+    todo_txt = os.path.join(home, "todo.txt")
+    failures = []
+
+    def check(title, pulls, expected, written):
+        """run pulls, check the requests they made and if todo.txt changed"""
+        del api.requests[:]
+        mtime = os.stat(todo_txt).st_mtime
+        time.sleep(0.01)
+        start = time.time()
+        for _ in xrange(pulls):
+            todo(home, api, "pull", "Remote")
+        elapsed = (time.time() - start) / pulls
+        made = [(method, path.split("/")[1], status)
+                for method, path, status in api.requests]
+        changed = os.stat(todo_txt).st_mtime != mtime
+        ok = made == expected * pulls and changed == written
+        print "%-32s %-40s %s %6.1f ms" % (
+            title, " ".join("%s %s %d" % request for request in made[:3]),
+            "ok" if ok else "FAILED", elapsed * 1000)
+        if not ok:
+            failures.append(title)
+
+    try:
+        os.makedirs(os.path.join(home, ".todo"))
+        with open(os.path.join(home, ".todo", "gist_id"), "w") as f:
+            f.write("0")
+        with open(todo_txt, "w") as f:
+            f.write("Local\n-----\n-     local task")
+
+        api.gists["0"] = {"Remote": u"Remote\n------\n-     remote task"}
+
+        check("first pull", 1, [("GET", "gists", 200)], True)
+        check("unchanged gist", 1, [("GET", "gists", 304)], False)
+
+        api.gists["0"]["Remote"] += u"\n- [x] done remotely"
+        check("changed gist", 1, [("GET", "gists", 200)], True)
+
+        api.gists["0"]["Other"] = u"Other\n-----"
+        check("other file changed, same todo", 1, [("GET", "gists", 200)],
+              False)
+
+        api.gists["0"]["Remote"] += u"".join(u"\n-     task %d" % index
+                                             for index in xrange(1000))
+        check("truncated file", 1, [("GET", "gists", 200),
+                                    ("GET", "raw", 200)], True)
+        check("truncated file unchanged", 5, [("GET", "gists", 304)], False)
+
+        with open(todo_txt, "a") as f:
+            f.write("\n-     local edit")
+        check("local edit, gist unchanged", 1, [("GET", "gists", 304)], True)
+
+        check_sync(api, home, failures)
+
+        check_new_gist(api, failures)
+
+        check_http(api, home, failures)
+    finally:
+        shutil.rmtree(home)
+        api.shutdown()
+        api.server_close()
+
+    if failures:
+        print "FAILED: %s" % ", ".join(failures)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
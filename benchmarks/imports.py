@@ -0,0 +1,99 @@
+# coding=utf8
+
+"""
+  Import regression check for the offline commands.
+
+  Runs each offline command in a fresh interpreter and fails if it loaded
+any of the modules only the gist commands need, or more modules than the
+cap. Also reports the wall time of each command::
+
+      python benchmarks/imports.py --cap 80
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+from common import root
+
+# print the modules loaded by the command to stderr, even if it exits
+script = """
+import sys
+sys.argv[0] = 'todo'
+from todo.server import main
+try:
+    main()
+finally:
+    sys.stderr.write(' '.join(name for name, module in sys.modules.items()
+                              if module is not None))
+"""
+
+commands = [
+    [],
+    ["--all"],
+    ["1"],
+    ["1", "done"],
+    ["1", "undone"],
+    ["search", "task"],
+    ["name"],
+    ["Go", "shopping"],
+    ["1", "remove"],
+]
+
+# top level packages an offline command must never import
+forbidden = ["requests", "urllib3", "json", "ply", "getpass", "ssl", "socket"]
+
+
+def run(args, cwd, env):
+    """run todo with args, return (seconds, loaded module names)"""
+    devnull = open(os.devnull, "w")
+    start = time.time()
+    process = subprocess.Popen([sys.executable, "-c", script] + args, cwd=cwd,
+                               env=env, stdout=devnull, stderr=subprocess.PIPE)
+    modules = process.communicate()[1].split()
+    elapsed = time.time() - start
+    devnull.close()
+    return elapsed, modules
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--cap", type=int, default=80,
+                           help="max modules an offline command may load")
+    opts = argparser.parse_args()
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=home, PYTHONPATH=root)
+    failures = []
+
+    try:
+        with open(os.path.join(home, "todo.txt"), "w") as f:
+            f.write("Imports\n-------\n- [x] task one\n-     task two")
+
+        for args in commands:
+            elapsed, modules = run(args, home, env)
+            loaded = sorted(set(name.split(".")[0] for name in modules) &
+                            set(forbidden))
+            command = " ".join(["todo"] + args)
+            print "%-22s %6.1f ms  %3d modules  %s" % (
+                command, elapsed * 1000, len(modules), " ".join(loaded))
+            if loaded:
+                failures.append("%s loaded %s" % (command, ", ".join(loaded)))
+            if len(modules) > opts.cap:
+                failures.append("%s loaded %d modules (cap %d)" % (
+                    command, len(modules), opts.cap))
+    finally:
+        shutil.rmtree(home)
+
+    for failure in failures:
+        print "FAIL: " + failure
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# coding=utf8
+
+"""
+  Memory benchmark of the two todo representations.
+
+  Parses a generated todo into one <Task> object per task (parser.parse),
+and into the column-wise <TaskStore> (scanner.store), each in a fresh
+interpreter, and reports the peak memory it took above the todo string::
+
+      python benchmarks/memory.py --sizes 100000,1000000
+
+  Python 2 has no tracemalloc, the peak is measured as the growth of the
+process' max resident set size.
+"""
+
+import os
+import sys
+import time
+import argparse
+import shutil
+import tempfile
+import subprocess
+
+from common import peak
+from common import make_todo
+
+
+def child(representation, path, size):
+    """build one representation, print 'peak_kb seconds'"""
+    from todo.parser import parser
+    from todo.parser import scanner
+
+    data = open(path).read()
+    before = peak()
+    start = time.time()
+
+    if representation == "objects":
+        todo = parser.parse(data)
+    else:
+        todo = scanner.store(data, scanner.scan(data))
+
+    elapsed = time.time() - start
+    assert len(todo.tasks) == size
+    print peak() - before, elapsed
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--sizes", default="100000,1000000")
+    argparser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    opts = argparser.parse_args()
+
+    if opts.child:
+        representation, path, size = opts.child
+        return child(representation, path, int(size))
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "todo.txt")
+
+    try:
+        for size in opts.sizes.split(","):
+            make_todo(path, int(size))
+            for representation in ("objects", "store"):
+                output = subprocess.check_output([
+                    sys.executable, __file__, "--child", representation, path,
+                    size
+                ])
+                kb, elapsed = output.split()
+                print "%8s tasks  %-8s %8.1f MB peak  %7.0f ms" % (
+                    size, representation, int(kb) / 1024.0,
+                    float(elapsed) * 1000)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# coding=utf8
+
+"""
+  Throughput benchmark of the todo.txt parsers.
+
+  Checks the single pass scanner, and its streaming iter_tasks() fed in
+small chunks, against the ply reference parser on a corpus of edge cases
+and on the generated lists, then times them::
+
+      python benchmarks/parse.py --sizes 10000,100000,1000000
+
+"""
+
+import time
+import argparse
+from StringIO import StringIO
+
+from common import todo_lines
+
+from todo.parser import scanner
+from todo.parser import ply_parser
+from todo.parser import TodoSyntaxError
+
+
+corpus = [
+    "",
+    "\n\n",
+    "-   task",
+    "- [x] task",
+    "-     task",
+    "- [x]task",
+    "-[x] task",
+    "- [x]  two spaces",
+    "-  [x]",
+    "-  [x] \nnext line",
+    "-   \nnext line",
+    "- [x] trailing spaces   \n-   b",
+    "- [x] crlf\r\n-   line\r\n",
+    "\t  -\t[x]\ttabs\n",
+    "name\n---\n- [x] a\n-   b",
+    "  name\n   ---  \n\n\n-   a",
+    "name\n\n\n---\n-   a",
+    "name\n--\n-   a",
+    "name\n---",
+    "a\n---\nb\n---",
+    "a\n---\n-   x\nb\n---",
+    "- [x] name like\n-----\n-   a",
+    "-   a\n\n   \n-   b\n\t\n",
+    "-   a\n*   b",
+    "-   a\n[x] b",
+    "just text",
+    "-   utf8 \xe4\xbd\xa0\xe5\xa5\xbd",
+    "\xe4\xbd\xa0\xe5\xa5\xbd\n------\n-   a",
+    "\xe4\xbd\xa0",
+    "  \r\n  name\n---\n-   a  \n-   b \t\n\n",
+    "-   a ]\n-  [x]\n- b\n-   c -\n-     \n- x",
+    "-   a\n---\n-   b",
+    "name\n---\n-   a\nname\n---",
+    "-   a\nname\n---\n-   b",
+]
+
+
+def result(parser, data):
+    """parse data, return a comparable result or the syntax error"""
+    try:
+        todo = parser.parse(data)
+    except TodoSyntaxError as e:
+        return "TodoSyntaxError: %s" % e
+    return todo.name, [(task.content, task.done) for task in todo.tasks]
+
+
+def stream(data, size):
+    """iter_tasks() over data as a file, returns like result()"""
+    name = ''
+    tasks = []
+    try:
+        for item in scanner.iter_tasks(StringIO(data), size):
+            if isinstance(item, str):
+                name = item
+            else:
+                tasks.append((item.content, item.done))
+    except TodoSyntaxError as e:
+        return "TodoSyntaxError: %s" % e
+    return name, tasks
+
+
+def check(data, sizes=(1, 2, 3, 5, 8, 64)):
+    """assert the scanner and its stream agree with the ply parser on data"""
+    expect = result(ply_parser, data)
+    got = result(scanner, data)
+    assert got == expect, "%r: %r != %r" % (data, got, expect)
+    raw = "\n %s \n" % data  # read from files, todo.txt is stripped
+    expect = result(ply_parser, raw.strip())
+    for size in sizes:
+        got = stream(raw, size)
+        assert got == expect, "%r/%d: %r != %r" % (data, size, got, expect)
+
+
+def timeit(parser, data):
+    """return the seconds to parse data"""
+    start = time.time()
+    parser.parse(data)
+    return time.time() - start
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--sizes", default="10000,100000")
+    argparser.add_argument("--skip-ply", action="store_true",
+                           help="only time the scanner (ply is slow on 1M)")
+    opts = argparser.parse_args()
+
+    for data in corpus:
+        check(data)
+    print "corpus: %d cases agree" % len(corpus)
+
+    for size in [int(size) for size in opts.sizes.split(",")]:
+        data = "".join(todo_lines(size))
+        scan = timeit(scanner, data)
+        line = "%8d tasks  scanner %8.1f ms" % (size, scan * 1000)
+        if not opts.skip_ply:
+            check(data, sizes=(4096,))
+            ply = timeit(ply_parser, data)
+            line += "  ply %8.1f ms  (x%.1f)" % (ply * 1000, ply / scan)
+        print line
+
+
+if __name__ == '__main__':
+    main()
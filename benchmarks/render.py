@@ -0,0 +1,70 @@
+# coding=utf8
+
+"""
+  Rendering benchmark, listing a large todo into a pipe.
+
+  Runs `todo --all`, `todo` and a search against a generated todo.txt,
+their output piped and counted, as `todo --all | grep ..` would read it,
+and reports the wall time beside `cat todo.txt`'s, the floor of the I/O::
+
+      python benchmarks/render.py --tasks 500000
+
+  Output to a pipe isn't colored, set TODO_COLOR=always to time the colors.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from common import root
+from common import script
+from common import make_todo
+
+
+def piped(args, cwd, env):
+    """run args, their output read from a pipe, return (seconds, bytes)"""
+    start = time.time()
+    process = subprocess.Popen(args, cwd=cwd, env=env,
+                               stdout=subprocess.PIPE)
+    size = 0
+    for chunk in iter(lambda: process.stdout.read(1 << 16), ""):
+        size += len(chunk)
+    assert process.wait() == 0
+    return time.time() - start, size
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--tasks", type=int, default=500000)
+    argparser.add_argument("--runs", type=int, default=3)
+    argparser.add_argument("--python", default=sys.executable)
+    opts = argparser.parse_args()
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=home, PYTHONPATH=root)
+    env.pop("TODO_PAGER", None)
+
+    try:
+        make_todo(os.path.join(home, "todo.txt"), opts.tasks,
+                  lambda index: "Task number %d, fix the parser" % index)
+        todo = [opts.python, "-c", script]
+        piped(todo, home, env)  # warm the os file cache, build the cache
+
+        for title, args in (("cat", ["cat", "todo.txt"]),
+                            ("todo --all", todo + ["--all"]),
+                            ("todo", todo),
+                            ("todo search", todo + ["search", "parser"])):
+            elapsed, size = min(piped(args, home, env)
+                                for _ in xrange(opts.runs))
+            print "%-12s %8.1f ms  %6.1f MB/s" % (
+                title, elapsed * 1000, size / elapsed / (1 << 20))
+    finally:
+        shutil.rmtree(home)
+
+
+if __name__ == '__main__':
+    main()
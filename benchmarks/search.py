@@ -0,0 +1,102 @@
+# coding=utf8
+
+"""
+  Search benchmark, the inverted index against the linear scan.
+
+  Generates a todo of random words, then times searches for a rare word, a
+common word and two words, each through the index (TodoIndex.search) and
+through a scan of every task's content, as `todo search` did::
+
+      python benchmarks/search.py --sizes 10000,100000,1000000
+
+  The index is built by the first search, which is timed apart. The todo
+and the index are loaded from disk on each run, as a command would.
+"""
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+from common import make_todo
+
+words = ["shopping", "milk", "bread", "report", "review", "call", "mail",
+         "fix", "bug", "deploy", "book", "read", "write", "meeting", "plan",
+         "garden", "clean", "car", "bank", "tax", "doctor", "gym", "paint"]
+
+
+def contents(size):
+    """return the contents of make_todo's tasks: random words, seeded"""
+    rand = random.Random(size)
+
+    def content(index):
+        content = " ".join(rand.sample(words, 4))
+        if index % 1000 == 0:
+            content += " urgent"
+        return "%s #%d" % (content, rand.randint(0, 9999))
+    return content
+
+
+def timed(func, runs):
+    """return func's result and its median time in seconds over runs"""
+    times = []
+    for _ in xrange(runs):
+        start = time.time()
+        result = func()
+        times.append(time.time() - start)
+    return result, sorted(times)[len(times) // 2]
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--sizes", default="10000,100000")
+    argparser.add_argument("--runs", type=int, default=5)
+    opts = argparser.parse_args()
+
+    home = tempfile.mkdtemp()
+    os.environ["HOME"] = home
+
+    from todo import app
+
+    try:
+        for size in map(int, opts.sizes.split(",")):
+            path = os.path.join(home, "todo.txt")
+            make_todo(path, size, contents(size))
+            os.chdir(home)
+            todo_app = app.App()
+            todo_app.todo  # parse and cache, as a prior command would
+            index = todo_app.todo_index
+
+            def load():
+                todo_app._todo = None
+                return todo_app.todo.tasks, todo_app._todo_stat
+
+            def indexed(strs):
+                tasks, stat = load()
+                return index.search(tasks, strs, stat)
+
+            def linear(strs):
+                tasks, stat = load()
+                return [i for i, task in enumerate(tasks)
+                        if all(s in task.content for s in strs)]
+
+            _, build = timed(lambda: indexed(["urgent"]), 1)
+            print "%d tasks, index built in %.1f ms" % (size, build * 1000)
+
+            for strs in (["urgent"], ["milk"], ["milk", "tax"]):
+                found, fast = timed(lambda: indexed(strs), opts.runs)
+                expected, slow = timed(lambda: linear(strs), opts.runs)
+                assert found == expected
+                print "  %-12s %7d found  index %8.1f ms  scan %8.1f ms" % (
+                    " ".join(strs), len(found), fast * 1000, slow * 1000)
+
+            os.remove(index.path)
+            os.remove(todo_app.todo_cache.path)
+    finally:
+        shutil.rmtree(home)
+
+
+if __name__ == '__main__':
+    main()
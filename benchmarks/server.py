@@ -0,0 +1,140 @@
+# coding=utf8
+
+"""
+  Server benchmark, `todo` commands run through `todo serve` in two
+directories.
+
+  Runs commands alternately in two directories, each with its own
+todo.txt: adds in both, then a task removed in the first (journaled) and a
+listing in the second, the last command. Once the server has been idle long
+enough to compact the journal, verifies each todo.txt holds its own list,
+and no journal is left. Reports the commands' times, through the server
+and run in process without it::
+
+      python benchmarks/server.py --tasks 1000 --runs 10
+"""
+
+import os
+import sys
+import time
+import signal
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from common import root
+from common import script
+from common import make_todo
+
+
+def todo(args, cwd, env):
+    """run `todo args` in cwd, return the elapsed seconds"""
+    devnull = open(os.devnull, "w")
+    start = time.time()
+    subprocess.check_call([sys.executable, "-c", script] + args, cwd=cwd,
+                          env=env, stdout=devnull)
+    elapsed = time.time() - start
+    devnull.close()
+    return elapsed
+
+
+def contents(path):
+    """the tasks' contents of a todo.txt"""
+    return [line[6:] for line in open(path).read().splitlines()
+            if line.startswith("- ")]
+
+
+def scenario(dirs, env, runs):
+    """run the commands in the two dirs, return their times by command"""
+    first, second = dirs
+    times = {"remove": [], "list": [], "add": []}
+
+    for run in xrange(runs):
+        for cwd in dirs:
+            times["add"].append(todo(["added %d" % run], cwd, env))
+        times["remove"].append(todo(["1", "remove"], first, env))
+        times["list"].append(todo(["--all"], second, env))
+    return times
+
+
+def verify(dirs, tasks, runs):
+    """return the failures: each list must be its own, fully written"""
+    failures = []
+    first, second = dirs
+
+    for cwd, removed in ((first, runs), (second, 0)):
+        path = os.path.join(cwd, "todo.txt")
+        want = ["Task number %d, go shopping" % index
+                for index in xrange(removed, tasks)]
+        want += ["added %d" % run for run in xrange(runs)]
+        if contents(path) != want:
+            failures.append("%s doesn't hold its list" % path)
+        if os.path.exists(os.path.join(cwd, ".todo.txt.journal")):
+            failures.append("%s's journal is left" % path)
+    return failures
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--tasks", type=int, default=1000)
+    argparser.add_argument("--runs", type=int, default=10)
+    opts = argparser.parse_args()
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=home, PYTHONPATH=root)
+    env.pop("TODO_PAGER", None)
+    dirs = [os.path.join(home, name) for name in ("first", "second")]
+    socket_path = os.path.join(home, ".todo", "todo.sock")
+    failures = []
+    results = {}
+
+    try:
+        for mode in ("in process", "server"):
+            for cwd in dirs:  # anew, without the last mode's journal
+                if os.path.exists(cwd):
+                    shutil.rmtree(cwd)
+                os.makedirs(cwd)
+                make_todo(os.path.join(cwd, "todo.txt"), opts.tasks)
+
+            server = None
+            if mode == "server":
+                devnull = open(os.devnull, "w")
+                server = subprocess.Popen(
+                    [sys.executable, "-c", script, "serve"], cwd=home,
+                    env=env, stdout=devnull)
+                devnull.close()
+                while not os.path.exists(socket_path):
+                    time.sleep(0.05)
+
+            try:
+                results[mode] = scenario(dirs, env, opts.runs)
+                if server is not None:
+                    time.sleep(2.5)  # idle, the journals are compacted
+            finally:
+                if server is not None:
+                    server.send_signal(signal.SIGTERM)
+                    server.wait()
+
+            if server is not None:
+                failures += verify(dirs, opts.tasks, opts.runs)
+    finally:
+        shutil.rmtree(home)
+
+    print "%d tasks, %d runs in each of two directories" % (opts.tasks,
+                                                           opts.runs)
+    for command in ("remove", "list", "add"):
+        print "  %-7s %s" % (command, "  ".join(
+            "%s %6.1f ms" % (mode, sorted(times)[len(times) // 2] * 1000)
+            for mode, times in ((mode, results[mode][command])
+                                for mode in ("in process", "server"))))
+
+    if failures:
+        for failure in failures:
+            print "FAILED: %s" % failure
+        sys.exit(1)
+    print "ok, each todo.txt holds its own list"
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# coding=utf8
+
+"""
+  Cold-start benchmark of the `todo` command.
+
+  Runs `todo` (plain listing of undone tasks) in a fresh interpreter
+several times against a generated todo.txt, and reports the wall time::
+
+      python benchmarks/startup.py --runs 20 --tasks 100
+
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+
+from common import root
+from common import script
+from common import make_todo
+
+
+def run(args, cwd, env):
+    """run the command once, return the elapsed seconds"""
+    devnull = open(os.devnull, "w")
+    start = time.time()
+    subprocess.check_call(args, cwd=cwd, env=env, stdout=devnull)
+    elapsed = time.time() - start
+    devnull.close()
+    return elapsed
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--runs", type=int, default=20)
+    argparser.add_argument("--tasks", type=int, default=100)
+    argparser.add_argument("--python", default=sys.executable)
+    opts = argparser.parse_args()
+
+    home = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=home, PYTHONPATH=root)
+
+    try:
+        make_todo(os.path.join(home, "todo.txt"), opts.tasks)
+        args = [opts.python, "-c", script]
+        run(args, home, env)  # warm the os file cache
+        times = sorted(run(args, home, env) for _ in range(opts.runs))
+    finally:
+        shutil.rmtree(home)
+
+    print "todo (plain listing), %d tasks, %d runs" % (opts.tasks, opts.runs)
+    print "  min     %.1f ms" % (times[0] * 1000)
+    print "  median  %.1f ms" % (times[len(times) // 2] * 1000)
+    print "  max     %.1f ms" % (times[-1] * 1000)
+
+
+if __name__ == '__main__':
+    main()
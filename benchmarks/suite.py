@@ -0,0 +1,251 @@
+# coding=utf8
+
+"""
+  Benchmark suite, the todo operations timed on generated todos of many
+sizes, stored as JSON to compare between commits.
+
+  Each case runs on each size in a fresh interpreter, on a todo.txt of that
+many tasks: a warm up run, then `runs` timed runs. The median and the best
+times are reported, with the peak memory: the growth of the max resident
+set size over all the runs for cases run in process, the max resident set
+size of the `todo` process for the others. Comparisons go by the best
+times, the least noisy. Commands run as `todo` runs them, with a
+fresh <App instance> each, their output to /dev/null::
+
+      python benchmarks/suite.py --sizes 10,1000,100000 --output new.json
+      python benchmarks/suite.py --output new.json --compare old.json
+
+  cases
+    parse       parser.parse() of todo.txt's content
+    generate    generator.generate() of the parsed todo
+    add         `todo <task>`
+    check       `todo <id> done` and `todo <id> undone`, alternately
+    remove      `todo 1 remove`
+    clear       `todo clear`, on todo.txt written anew before each run
+    compact     a rename's journal compacted, todo.txt rewritten whole
+    search      `todo search number 7`, its index built by the warm up
+    startup     `todo`, in a new process
+    push        `todo push --force`, to the stand-in gist api (gist_api.py)
+    pull        `todo pull`, from it, the gist not cached and todo.txt
+                written anew before each run
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+from common import root
+from common import script
+from common import peak
+from common import make_todo
+
+cases = ["parse", "generate", "add", "check", "remove", "clear", "compact",
+         "search", "startup", "push", "pull"]
+
+
+def command(args):
+    """run a todo command in process, its output to /dev/null"""
+    from todo.app import App
+    stdout, sys.argv = sys.stdout, ["todo"] + args
+    sys.stdout = open(os.devnull, "w")
+    try:
+        App().run()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def spawn(args, env):
+    """run `todo args` in a new process, return its max resident set size"""
+    devnull = open(os.devnull, "w")
+    process = subprocess.Popen([sys.executable, "-c", script] + args,
+                               env=env, stdout=devnull, stderr=devnull)
+    devnull.close()
+    _, status, usage = os.wait4(process.pid, 0)
+    assert status == 0, "todo %s failed" % " ".join(args)
+    return usage.ru_maxrss
+
+
+def child(case, size, home, runs):
+    """
+      Run a case on a todo of size tasks in home, print its result as JSON:
+    {"seconds": median, "best": min, "peak_kb": peak memory}.
+    """
+    os.environ["HOME"] = home
+    os.chdir(home)
+    todo_txt = os.path.join(home, "todo.txt")
+    make_todo(todo_txt, size)
+    content = open(todo_txt).read()
+
+    from todo.parser import parser
+    from todo.generator import generator
+
+    setup = lambda: None
+    processes = []  # the peaks of the todo processes run
+    api = None
+
+    if case == "parse":
+        run = lambda: parser.parse(content)
+    elif case == "generate":
+        todo = parser.parse(content)
+        run = lambda: generator.generate(todo)
+    elif case in ("add", "remove", "clear", "search"):
+        args = {"add": ["benchmark", "task"], "remove": ["1", "remove"],
+                "clear": ["clear"], "search": ["search", "number", "7"]}
+        run = lambda: command(args[case])
+        if case == "clear":
+            setup = lambda: make_todo(todo_txt, size)
+    elif case == "compact":
+        from todo.app import App
+        names = iter("Renamed-%d" % run for run in xrange(runs + 1))
+        setup = lambda: command(["name", next(names)])
+        run = lambda: App().compact()
+    elif case == "check":
+        checks = iter([str(size // 2 + 1), state]
+                      for state in ["done", "undone"] * (runs + 1))
+        run = lambda: command(next(checks))
+    else:
+        from gist_api import GistAPI
+
+        env = dict(os.environ, PYTHONPATH=root)
+        args = {"startup": [], "push": ["push", "--force"],
+                "pull": ["pull", "Benchmark"]}[case]
+        run = lambda: processes.append(spawn(args, env))
+
+        if case != "startup":
+            api = GistAPI().start()
+            env["TODO_GITHUB_API"] = api.url
+            api.gists["0"] = {"Benchmark": content.decode("utf8")}
+            os.makedirs(os.path.join(home, ".todo"))
+            for name, value in (("gist_id", "0"), ("github_token", "token")):
+                with open(os.path.join(home, ".todo", name), "w") as f:
+                    f.write(value)
+
+        if case == "pull":
+            def setup():
+                with open(todo_txt, "w") as f:
+                    f.write("Benchmark\n---------\n-     local task")
+                pulled = os.path.join(home, ".todo", "cache", "gist.0")
+                if os.path.exists(pulled):
+                    os.remove(pulled)
+
+    before = peak()
+    setup()
+    run()  # warm up: caches, indexes, os file cache
+    times = []
+
+    for _ in xrange(runs):
+        setup()
+        start = time.time()
+        run()
+        times.append(time.time() - start)
+
+    if api is not None:
+        api.shutdown()
+        api.server_close()
+
+    print json.dumps({
+        "seconds": sorted(times)[len(times) // 2],
+        "best": min(times),
+        "peak_kb": max(processes) if processes else peak() - before,
+    })
+
+
+def revision():
+    """the git revision of the tree benchmarked, None if unknown"""
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"], cwd=root,
+            stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold):
+    """print the results of new against old, return the regressions"""
+    regressions = []
+    print "compared to %s:" % (old.get("revision") or "?")
+
+    for case in cases:
+        for size, result in sorted(new["results"].get(case, {}).items(),
+                                   key=lambda item: int(item[0])):
+            base = old["results"].get(case, {}).get(size)
+            if base is None:
+                continue
+            ratio = result["best"] / max(base["best"], 1e-9)
+            slower = ratio > threshold
+            if slower:
+                regressions.append("%s/%s" % (case, size))
+            print "  %-9s %8s tasks %10.2f ms -> %10.2f ms  x%.2f%s" % (
+                case, size, base["best"] * 1000, result["best"] * 1000,
+                ratio, "  SLOWER" if slower else "")
+    return regressions
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--sizes", default="10,1000,100000")
+    argparser.add_argument("--runs", type=int, default=5)
+    argparser.add_argument("--cases", default=",".join(cases))
+    argparser.add_argument("--output", help="the JSON file to write")
+    argparser.add_argument("--compare", help="a JSON file written before")
+    argparser.add_argument("--threshold", type=float, default=1.2,
+                           help="time ratio over which a case regressed")
+    argparser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    opts = argparser.parse_args()
+
+    if opts.child:
+        case, size, home, runs = opts.child
+        return child(case, int(size), home, int(runs))
+
+    sizes = [int(size) for size in opts.sizes.split(",")]
+    results = {}
+
+    for case in opts.cases.split(","):
+        if case not in cases:
+            argparser.error("unknown case %r, cases: %s" % (
+                case, ", ".join(cases)))
+        results[case] = {}
+        for size in sizes:
+            home = tempfile.mkdtemp()
+            try:
+                output = subprocess.check_output([
+                    sys.executable, __file__, "--child", case, str(size),
+                    home, str(opts.runs)])
+            finally:
+                shutil.rmtree(home)
+            result = results[case][str(size)] = json.loads(output)
+            print "%-9s %8d tasks %10.2f ms  best %10.2f ms %10d KB" % (
+                case, size, result["seconds"] * 1000, result["best"] * 1000,
+                result["peak_kb"])
+
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": opts.runs,
+        "results": results,
+    }
+
+    if opts.output:
+        with open(opts.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True,
+                      separators=(",", ": "))
+
+    if opts.compare:
+        with open(opts.compare) as f:
+            regressions = compare(json.load(f), report, opts.threshold)
+        if regressions:
+            print "SLOWER: %s" % ", ".join(regressions)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
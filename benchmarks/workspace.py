@@ -0,0 +1,91 @@
+# coding=utf8
+
+"""
+  Workspace benchmark, loading many lists serially against by a pool.
+
+  Generates a tree of todo lists, then times loading all of them, as
+`todo workspace` does, in process and by a pool of processes: cold (no
+cache, every list is scanned), warm (from the caches), and a search::
+
+      python benchmarks/workspace.py --lists 2000 --tasks 50
+
+  The results of the modes are checked equal.
+"""
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+import common  # puts the tree benchmarked first on sys.path
+
+words = ["fix", "bug", "deploy", "review", "write", "docs", "release", "test",
+         "refactor", "parser", "cache", "index", "server", "client", "merge"]
+
+
+def make_lists(home, lists, tasks):
+    """write `lists` todo.txts of `tasks` tasks under home/src"""
+    rand = random.Random(lists)
+    for index in xrange(lists):
+        path = os.path.join(home, "src", "group-%d" % (index % 10),
+                            "repo-%04d" % index)
+        os.makedirs(path)
+        with open(os.path.join(path, "todo.txt"), "w") as f:
+            name = "repo-%04d" % index
+            f.write("%s\n%s" % (name, "-" * len(name)))
+            for _ in xrange(tasks):
+                done = "[x]" if rand.random() < 0.5 else "   "
+                f.write("\n- %s %s" % (done, " ".join(rand.sample(words, 4))))
+
+
+def timed(func):
+    """return func's result and its time in seconds"""
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+def main():
+    argparser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    argparser.add_argument("--lists", type=int, default=2000)
+    argparser.add_argument("--tasks", type=int, default=50)
+    argparser.add_argument("--processes", type=int,
+                           default=multiprocessing.cpu_count())
+    opts = argparser.parse_args()
+
+    home = tempfile.mkdtemp()
+    os.environ["HOME"] = home
+
+    from todo.workspace import Workspace
+
+    try:
+        make_lists(home, opts.lists, opts.tasks)
+        cache_dir = os.path.join(home, ".todo", "cache")
+        print "%d lists of %d tasks, %d cpus" % (
+            opts.lists, opts.tasks, multiprocessing.cpu_count())
+
+        for title, strs, cold in (("cold", None, True), ("warm", None, False),
+                                  ("search", ["bug", "parser"], False)):
+            results = {}
+            if not cold:  # caches and indexes built
+                list(Workspace(os.path.join(home, "src"), 1).load(strs))
+            for processes in (1, opts.processes):
+                if cold and os.path.exists(cache_dir):
+                    shutil.rmtree(cache_dir)
+                workspace = Workspace(os.path.join(home, "src"), processes)
+                workspace.serial = 0
+                lists, elapsed = timed(lambda: list(workspace.load(strs)))
+                results[processes] = lists
+                print "  %-8s %2d processes %8.1f ms  %d tasks" % (
+                    title, processes, elapsed * 1000,
+                    sum(len(tasks) for _, _, tasks, _ in lists))
+            assert results[1] == results[opts.processes]
+    finally:
+        shutil.rmtree(home)
+
+
+if __name__ == '__main__':
+    main()
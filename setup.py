@@ -15,7 +15,7 @@ setup(
     include_package_data=True,
     entry_points={
         'console_scripts': [
-            'todo = todo.app:main'
+            'todo = todo.server:main'
         ]
     },
     long_description=open('README.md').read(),
@@ -13,19 +13,31 @@
 
 """
 Usage:
-  todo [-h|-v|-a]
+  todo [-h|-v|-a] [--offset=<n>] [--limit=<n>]
+  todo [-a] --tail=<n>
   todo clear
   todo name [<new_name>]
-  todo search <str>
+  todo search <str>... [--offset=<n>] [--limit=<n>]
+  todo search <str>... --tail=<n>
+  todo batch [<file>]
+  todo serve
   todo gist_id [<new_gist_id>]
-  todo push
+  todo push [--force]
   todo pull [<name>]
+  todo sync (push [--force]|pull)
+  todo workspace [-a] [--dir=<dir>]
+  todo workspace search <str>... [--dir=<dir>]
   todo (<id> [done|undone|remove])|<task>...
 
 Options:
   -h --help      show this message
   -v --version   show version
   -a --all       show all
+  -f --force     push even if unchanged since the last push
+  -d --dir=<dir>  the workspace's directory [default: .]
+  -o --offset=<n>  skip the first <n> tasks
+  -n --limit=<n>   print <n> tasks at most
+  -t --tail=<n>    print the last <n> tasks
 
 Examples:
   Add a task                    todo Go shopping!
@@ -34,15 +46,44 @@ Examples:
   Print all tasks               todo --all
   Print undone tasks            todo
   Search a task by content      todo search 'some str'
+  Search tasks having all strs  todo search shopping milk
+  Print the first 20 undone     todo --limit 20
+  Print the next 20 undone      todo --offset 20 --limit 20
+  Print the last 10 tasks       todo --all --tail 10
   Remove a task                 todo 1 remove
+  Check tasks 3 to 400 as done  todo 3-400 done
+  Remove tasks 1, 5 and 9       todo 1,5,9 remove
+  Check all but last 10 done    todo :-10 done
+  Run operations from stdin     todo batch < ops.txt
+  Keep todos loaded in a server todo serve
   Rename the todo               todo name <a-new-name>
   Get the name of todo          todo name
   Push to gist.github.com       todo push
+  Push even if unchanged        todo push --force
   Pull todo from gist           todo pull my_todo
   Set gist's id                 todo gist_id xxxxx
   Get gist's id                 todo gist_id
+  Push all the lists to sync    todo sync push
+  Pull all the lists to sync    todo sync pull
+  Undone tasks of all the lists todo workspace --dir ~/src
+  Search all the lists          todo workspace search bug
 You can edit the todo.txt directly.
 
+Batch operations, one per line, ids are the tasks' ids before the batch,
+tasks added get the ids following them:
+  add <task>, done <id>, undone <id>, remove <id>, name <new_name>
+
+Lists to sync are set in ~/.todo/sync, a line each:
+  <gist_id> <todo.txt's path or glob> [<file name>]
+
+A workspace is the todo.txts under a directory, out of hidden directories.
+
+Output is colored on terminals only, TODO_COLOR=always|never overrides it.
+Listings are paged by TODO_PAGER if set, e.g. TODO_PAGER='less -FRX'.
+TODO_TRACE=1 writes the time and memory of a command's phases (reading,
+parsing, writing, each Github request..) to stderr as JSON, TODO_PROFILE=<file>
+dumps its cProfile stats to the file, or prints them if <file> is -.
+
 To feedback, please visit https://github.com/secreek/todo
 
 """
@@ -54,16 +95,36 @@ from models import Todo
 from models import Github
 
 from parser import parser
+from parser import scanner
 from generator import generator
 
 from utils import log
+from utils import color
 from utils import colored
+from utils import Output
 from utils import ask_input
 
 import os
+import re
 import sys
-import requests
-from docopt import docopt
+import mmap
+import bisect
+import time
+import marshal
+from array import array
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks, todo.txt isn't locked
+    fcntl = None
+
+
+class TodoChanged(Exception):
+    """todo.txt changed since the todo was loaded, so it can't be written"""
+
+
+class GistError(Exception):
+    """a gist can't be fetched"""
 
 
 class File(object):
@@ -78,9 +139,116 @@ class File(object):
         """Read from file return the content"""
         return open(self.path).read().strip()
 
+    def map(self):
+        """
+          Map this file into memory read only, return (data, stat). data is
+        a mmap, or '' if the file is empty, which can't be mapped.
+        """
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if not stat.st_size:
+                return '', stat
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), stat
+
     def write(self, content):
-        """Write string to this file"""
-        return open(self.path, 'w').write(content.strip())
+        """
+          Write string to this file, stripped. It is replaced at once: the
+        string is written to a temporary file beside it, synced, and renamed
+        over it with its mode, so a crash never leaves it half written.
+        """
+        self.write_chunks((content,))
+
+    def write_chunks(self, chunks, synced=None):
+        """
+          Write the string chunks of an iterable to this file, as write()
+        writes them joined, stripped as a whole. The chunks are written to
+        the temporary file as they come, so the content is never in memory
+        whole. See replace() for synced.
+        """
+        def write(f):
+            spaces = None  # trailing whitespace so far, None at start
+            for chunk in chunks:
+                if spaces is None:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                    spaces = ''
+                content = chunk.rstrip()
+                if content:  # the whitespace held back wasn't trailing
+                    f.write(spaces)
+                    f.write(content)
+                    spaces = chunk[len(content):]
+                else:
+                    spaces += chunk
+
+        self.replace(write, synced=synced)
+
+    def replace(self, write, sync=True, mode=None, synced=None):
+        """
+          Replace this file at once with what write(f) writes to f, a
+        temporary file beside it, which is then synced, unless sync is False
+        (for caches, which can be lost), given this file's mode (or mode),
+        and renamed over it. If given, synced(stat) is called with its stat
+        before the rename. A crash never leaves this file half written.
+        """
+        path = os.path.realpath(self.path)  # replace a symlink's target
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                write(f)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            try:
+                if mode is None:
+                    mode = os.stat(path).st_mode
+                os.chmod(tmp_path, mode & 0o7777)
+            except OSError:  # a new file
+                pass
+            if synced is not None:
+                synced(os.stat(tmp_path))
+            os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def append(self, line):
+        """
+          Append a line to this file, starting a new line if needed. Return
+        the offset the line is written at.
+        """
+        with open(self.path, 'a+') as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            if offset:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != '\n':
+                    line = '\n' + line
+                    offset += 1
+            f.seek(0, os.SEEK_END)
+            f.write(line)
+        return offset
+
+    def patch(self, patches):
+        """
+          Overwrite bytes in place, patches are (offset, old, new): the
+        bytes `old` at offset are replaced with `new`. Return the file's stat
+        after it, or None if the bytes at an offset aren't `old`, patches
+        before it are applied.
+        """
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            for offset, old, new in patches:
+                os.lseek(fd, offset, os.SEEK_SET)
+                if os.read(fd, len(old)) != old:
+                    return None
+                os.lseek(fd, offset, os.SEEK_SET)
+                os.write(fd, new)
+            return os.fstat(fd)
+        finally:
+            os.close(fd)
 
 
 class TodoTxt(File):
@@ -94,22 +262,901 @@ class TodoTxt(File):
         write   write str to todo.txt
     """
 
-    def __init__(self):
-        """ Use './todo.txt' prior to '~/todo.txt' for persistent storage."""
+    def __init__(self, path=None):
+        """
+          Use './todo.txt' prior to '~/todo.txt' for persistent storage,
+        unless a path is given. The path is kept absolute, so the todo.txt
+        stays the same if the cwd changes, as it does in the server.
+        """
 
         filename = "todo.txt"
 
         current_path = os.path.join(".", filename)
         home_path = os.path.join(self.home, filename)
 
-        if os.path.exists(current_path):
+        if path is not None:
+            pass
+        elif os.path.exists(current_path):
             path = current_path
         else:
             # touch the '~/todo.txt' if it not exists
             open(home_path, "a").close()
             path = home_path
 
-        super(TodoTxt, self).__init__(path)
+        super(TodoTxt, self).__init__(os.path.abspath(path))
+
+
+class TodoCache(File):
+    """
+      Cache of the parsed todo.txt, in '~/.todo/cache/'.
+
+      The todo's columns are stored with marshal, together with the identity
+    of the todo.txt they were scanned from: path, inode, size and mtime. The
+    cache is only loaded while the identity is unchanged, so a hand edit of
+    the todo.txt just misses it. Like git's racily clean entries, on file
+    systems with whole second mtimes, a todo.txt modified in the same second
+    the cache was saved is not trusted either.
+
+      The tasks' contents are not cached, only their offsets: a cached todo
+    is a <TaskStore> over the mapped todo.txt. The tasks' line offset index
+    (see Scanner.scan) lets check() flip a task's done mark in place.
+
+      A task appended to todo.txt, or tasks checked in place, are appended
+    to the cache as a record after the columns, stamped with the todo.txt's
+    new identity: the last record's stamp is the cache's. The columns are
+    rewritten only once there are `max_amends` records.
+
+      attributes
+        txt_path    str     todo.txt's absolute filepath
+        path        str     the cache's filepath
+      methods
+        stat        stat the todo.txt
+        load        return the cached <Todo instance>, or None
+        save        scan the todo.txt's data and cache it
+        append      follow a task appended to todo.txt
+        check       check tasks done or undone in todo.txt in place
+    """
+
+    version = 5
+
+    max_amends = 256  # records after the columns, then they are rewritten
+
+    max_patches = 4096  # checking more tasks, rewriting todo.txt is faster
+
+    def __init__(self, txt_path):
+        self.txt_path = os.path.abspath(txt_path)
+        self.cache_dir = os.path.join(self.home, ".todo", "cache")
+        filename = self.txt_path.replace(os.sep, "%")
+        super(TodoCache, self).__init__(os.path.join(self.cache_dir, filename))
+        self.amends = 0  # the records read after the columns
+        self.end = None  # the size of the entry read
+
+    def stat(self):
+        """stat the todo.txt, take it before reading or after writing it"""
+        return os.stat(self.txt_path)
+
+    def identity(self, stat):
+        """the todo.txt's identity from its stat"""
+        mtime = getattr(stat, "st_mtime_ns", stat.st_mtime)
+        return (self.txt_path, stat.st_ino, stat.st_size, mtime)
+
+    def entry(self, stat):
+        """
+          return the cached columns (see Scanner.scan) of the todo.txt with
+        this stat, None if missed.
+        """
+        amends = []
+        try:
+            with open(self.path, "rb") as f:
+                version, identity, saved, entry = marshal.load(f)
+                end = f.tell()
+                while True:
+                    try:
+                        amends.append(marshal.load(f))
+                    except EOFError:  # the end, or a record cut by a crash
+                        break
+                    end = f.tell()
+            name, starts, ends, dones, markers = entry
+            if amends:
+                identity, saved = amends[-1][:2]
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+        if version != self.version or identity != self.identity(stat):
+            return None
+        mtime = stat.st_mtime
+        if mtime == int(mtime) and mtime >= int(saved):  # racily clean
+            return None
+
+        columns = [array('l'), array('l'), bytearray(dones), array('l')]
+        columns[0].fromstring(starts)
+        columns[1].fromstring(ends)
+        columns[3].fromstring(markers)
+        columns = tuple([name] + columns)
+        for amend in amends:
+            self.apply(columns, amend[2])
+        self.amends, self.end = len(amends), end
+        return columns
+
+    def apply(self, columns, patch):
+        """apply a patch of amend() to the columns"""
+        if patch[0] == "append":
+            for column, value in zip(columns[1:], patch[1:]):
+                column.append(value)
+        elif patch[0] == "check":
+            indexes, done = patch[1:]
+            for index in indexes:
+                columns[3][index] = done
+
+    def load(self, data, stat):
+        """
+          return the cached <Todo instance> of todo.txt's data and stat, as
+        returned by File.map(), None if missed.
+        """
+        columns = self.entry(stat)
+        if columns is None:
+            return None
+        return scanner.store(data, columns)
+
+    def store(self, columns, stat):
+        """write the cache entry, failures are ignored, it is optional"""
+        name, starts, ends, dones, markers = columns
+        entry = (name, starts.tostring(), ends.tostring(), str(dones),
+                 markers.tostring())
+        data = (self.version, self.identity(stat), time.time(), entry)
+
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            self.replace(lambda f: marshal.dump(data, f), sync=False)
+        except (IOError, OSError):
+            pass
+
+    def amend(self, columns, patch, stat):
+        """
+          Amend the cache entry of the columns read with a patch, stamped
+        with stat: append its record, or once there are `max_amends` of them,
+        store the columns patched. Failures are ignored.
+        """
+        if self.amends >= self.max_amends:
+            self.apply(columns, patch)
+            self.store(columns, stat)
+            return
+
+        record = marshal.dumps((self.identity(stat), time.time(), patch))
+        try:
+            fd = os.open(self.path, os.O_WRONLY)
+            try:
+                os.ftruncate(fd, self.end)  # a record cut by a crash
+                os.lseek(fd, self.end, os.SEEK_SET)
+                os.write(fd, record)
+            finally:
+                os.close(fd)
+        except OSError:
+            return
+        self.amends += 1
+        self.end += len(record)
+
+    def save(self, data, stat):
+        """
+          Scan the todo.txt's data (a str or mmap) and cache it, with the
+        todo.txt's stat taken when data was read or written. Return the
+        columns, or None if data has syntax errors.
+        """
+        pos, endpos = scanner.bounds(data)
+        columns = scanner.scan(data, pos, endpos)
+
+        if columns is not None:
+            self.store(columns, stat)
+        return columns
+
+    def append(self, offset, line, before, after):
+        """
+          Add the task of a line appended to todo.txt at offset to the
+        cache, given todo.txt's stats before and after. Nothing is done if
+        the cache missed before, so it misses after.
+        """
+        columns = self.entry(before)
+        added = scanner.scan(line)
+
+        if columns is None or added is None:
+            return
+        if added[0] or len(added[3]) != 1:  # not one task
+            return
+
+        start, end, done, marker = [column[0] for column in added[1:]]
+        if marker >= 0:
+            marker += offset
+        self.amend(columns, ("append", start + offset, end + offset, done,
+                             marker), after)
+
+    def check(self, todo_txt, indexes, done):
+        """
+          Check the tasks at indexes (0 based) done or undone by patching
+        their marks in todo_txt, without writing anything if their states are
+        the same. Return False if it can't: the cache missed, an index is out
+        of range, a task's line is not in the generator's layout or there are
+        too many marks to patch.
+        """
+        columns = self.entry(self.stat())
+
+        if columns is None:
+            return False
+
+        dones, markers = columns[3], columns[4]
+        old, new = ('   ', '[x]') if done else ('[x]', '   ')
+        patches = []
+
+        for index in indexes:
+            if not 0 <= index < len(dones) or markers[index] < 0:
+                return False
+            if dones[index] != done:
+                patches.append((markers[index], old, new))
+
+        if not patches:
+            return True
+        if len(patches) > self.max_patches:
+            return False
+
+        stat = todo_txt.patch(patches)
+
+        if stat is None:
+            return False
+
+        self.amend(columns, ("check", list(indexes), 1 if done else 0), stat)
+        return True
+
+
+class TodoPostings(File):
+    """
+      The postings of the index (see TodoIndex), in a file beside it: the
+    serials of the tasks having each token, laid out to be read in part.
+
+      The tokens are sorted and numbered, and indexed by their trigrams (a
+    token shorter than 3 by itself). A token is looked up in the tokens
+    having all its trigrams, or if shorter than 3, having a trigram which
+    contains it, and only their postings are read.
+
+      The file starts with a marshal record (generation, grams, sizes),
+    grams maps each trigram to the (start, count) of its tokens' numbers.
+    Then packed arrays and strings follow, read from the file mapped: the
+    tokens' numbers of each trigram, the tokens' offsets, the tokens, the
+    postings' offsets and the postings.
+
+      methods
+        write       write the postings, a {token: packed serials} dict
+        open        map the file, False if not of the generation given
+        lookup      return the serials of the tasks having a token
+        items       yield the (token, packed serials) of every token
+        close       unmap the file
+    """
+
+    size = array('l').itemsize
+
+    def __init__(self, index_path):
+        super(TodoPostings, self).__init__(index_path + ".postings")
+        self.data = None
+
+    def trigrams(self, token):
+        """the trigrams of a token, a token shorter than 3 itself"""
+        if len(token) < 3:
+            return set([token])
+        return set(token[i:i + 3] for i in xrange(len(token) - 2))
+
+    def write(self, postings, generation):
+        """write the postings with this generation, raises IOError, OSError"""
+        tokens = sorted(postings)
+        grams = {}
+
+        for number, token in enumerate(tokens):
+            for gram in self.trigrams(token):
+                if gram in grams:
+                    grams[gram].append(number)
+                else:
+                    grams[gram] = array('l', [number])
+
+        numbers = array('l')
+        for gram in grams:
+            start = len(numbers)
+            numbers.extend(grams[gram])
+            grams[gram] = (start, len(grams[gram]))
+
+        token_offsets = array('l', [0])
+        offsets = array('l', [0])
+        for token in tokens:
+            token_offsets.append(token_offsets[-1] + len(token))
+            offsets.append(offsets[-1] + len(postings[token]))
+
+        header = (generation, grams,
+                  (len(numbers), len(tokens), token_offsets[-1]))
+
+        def write(f):
+            marshal.dump(header, f)
+            f.write(numbers.tostring())
+            f.write(token_offsets.tostring())
+            f.writelines(tokens)
+            f.write(offsets.tostring())
+            f.writelines(postings[token] for token in tokens)
+
+        self.replace(write, sync=False)
+
+    def open(self, generation):
+        """map the postings, return False if missing or not of generation"""
+        try:
+            with open(self.path, "rb") as f:
+                header = marshal.load(f)
+                start = f.tell()
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, EOFError, ValueError, TypeError):
+            return False
+
+        if header[0] != generation:
+            self.close()
+            return False
+
+        self.grams = header[1]
+        numbers, self.count, size = header[2]
+        self.numbers_at = start
+        self.token_offsets_at = self.numbers_at + numbers * self.size
+        self.tokens_at = self.token_offsets_at + (self.count + 1) * self.size
+        self.offsets_at = self.tokens_at + size
+        self.postings_at = self.offsets_at + (self.count + 1) * self.size
+        return True
+
+    def longs(self, at, count):
+        """the array of count longs at offset at"""
+        values = array('l')
+        values.fromstring(self.data[at:at + count * self.size])
+        return values
+
+    def token(self, number):
+        """the token numbered number"""
+        start, end = self.longs(self.token_offsets_at + number * self.size, 2)
+        return self.data[self.tokens_at + start:self.tokens_at + end]
+
+    def serials(self, number):
+        """the packed serials of the token numbered number"""
+        start, end = self.longs(self.offsets_at + number * self.size, 2)
+        return self.data[self.postings_at + start:self.postings_at + end]
+
+    def numbers(self, gram):
+        """the numbers of the tokens having this trigram"""
+        start, count = self.grams.get(gram, (0, 0))
+        return self.longs(self.numbers_at + start * self.size, count)
+
+    def lookup(self, token):
+        """the set of serials of the tasks having a token containing token"""
+        if len(token) < 3:  # a trigram has it, or it's in a short token
+            numbers = set()
+            for gram in self.grams:
+                if token in gram:
+                    numbers.update(self.numbers(gram))
+        else:
+            numbers = None
+            counts = dict((gram, self.grams.get(gram, (0, 0))[1])
+                          for gram in self.trigrams(token))
+            for gram in sorted(counts, key=counts.get):  # fewest first
+                if numbers is None:
+                    numbers = set(self.numbers(gram))
+                else:
+                    numbers.intersection_update(self.numbers(gram))
+                if not numbers:
+                    return set()
+            numbers = [number for number in numbers
+                       if token in self.token(number)]
+
+        serials = set()
+        for number in numbers:
+            serials.update(array('l', self.serials(number)))
+        return serials
+
+    def items(self):
+        """yield the (token, packed serials) of every token"""
+        for number in xrange(self.count):
+            yield self.token(number), self.serials(number)
+
+    def close(self):
+        """unmap the postings"""
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+
+class TodoIndex(TodoCache):
+    """
+      Inverted index of the tasks' contents for search, in '~/.todo/cache/'
+    beside the todo's cache.
+
+      Tasks get serial numbers in the order they are added, and the index
+    maps each token of the contents (a run of letters, digits, '_' or utf8
+    bytes) to the serials of the tasks having it. The serials of the tasks
+    in todo.txt are kept in order, so a task's position is found by bisect,
+    and removing a task just drops its serial.
+
+      A task has a str only if it has a token containing each token of the
+    str, so these tasks are the candidates, then the str is matched against
+    their contents. A str without tokens is matched against every task. The
+    tokens containing a token are looked up by trigrams, see TodoPostings.
+
+      Like the cache, the index is stamped with the todo.txt's identity. App
+    keeps it up to date through its own writes, each method takes the stats
+    of todo.txt before and after the write and does nothing if the index
+    wasn't up to date before. After a hand edit, or if it has more or fewer
+    tasks than the todo, the next search rebuilds it.
+
+      The index is three files. This one is small: the stamp, then the head
+    record (next, dead, count, appended, added, generations), that is the
+    next serial, the number of removed tasks still in the postings, the
+    number of serials in the serials file, the serials appended since, the
+    (serial, tokens) of the tasks added since the postings were written, and
+    the generations of the serials and postings files, which are beside it.
+    So adding a task or stamping the index writes the head only, removing a
+    task the serials too, and the postings are written once `max_added`
+    tasks were added.
+
+      methods
+        search      return the positions of the tasks having all the strs
+        add         index a task appended to todo.txt
+        remove      drop a task removed from todo.txt
+        clear       empty the index, all tasks cleared
+        touch       follow a write of todo.txt that kept the contents
+    """
+
+    version = 2
+
+    max_added = 1024  # tasks added, then their postings are written
+
+    token = re.compile(r"[0-9A-Za-z_\x80-\xff]+")
+
+    def __init__(self, txt_path):
+        super(TodoIndex, self).__init__(txt_path)
+        self.path += ".index"
+        self.serials = File(self.path + ".serials")
+        self.postings = TodoPostings(self.path)
+
+    def tokens(self, content):
+        """the distinct tokens of a content"""
+        return set(self.token.findall(content))
+
+    def read_head(self, stat):
+        """
+          return the head record of the index of the todo.txt with this
+        stat, None if it is stale or missing.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                version, identity, saved = marshal.load(f)
+                if (version != self.version or
+                        identity != self.identity(stat)):
+                    return None
+                mtime = stat.st_mtime
+                if mtime == int(mtime) and mtime >= int(saved):
+                    return None  # racily clean
+                return marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+    def read_serials(self, generation):
+        """return the serials file's array, None if not of generation"""
+        try:
+            with open(self.serials.path, "rb") as f:
+                saved, serials = marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+        if saved != generation:
+            return None
+        return array('l', serials)
+
+    def write_index(self, stat, head, postings=None, serials=None):
+        """
+          write the head stamped with stat, after the postings and the
+        serials if given, with the generations it names. Return False if it
+        failed, failures are otherwise ignored.
+        """
+        stamp = (self.version, self.identity(stat), time.time())
+        serials_generation, postings_generation = head[5]
+
+        def write(f):
+            marshal.dump(stamp, f)
+            marshal.dump(head, f)
+
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            if postings is not None:
+                self.postings.write(postings, postings_generation)
+            if serials is not None:
+                record = (serials_generation, serials.tostring())
+                self.serials.replace(lambda f: marshal.dump(record, f),
+                                     sync=False)
+            self.replace(write, sync=False)
+        except (IOError, OSError):
+            return False
+        return True
+
+    def build(self, tasks, stat):
+        """
+          index the tasks read from todo.txt with this stat, return the
+        head, None if the index can't be written.
+        """
+        postings = {}
+
+        for serial, task in enumerate(tasks):
+            for token in self.tokens(task.content):
+                if token in postings:
+                    postings[token].append(serial)
+                else:
+                    postings[token] = array('l', [serial])
+
+        for token in postings:
+            postings[token] = postings[token].tostring()
+
+        generation = os.urandom(8)
+        head = (len(tasks), 0, len(tasks), [], [], (generation, generation))
+        serials = array('l', xrange(len(tasks)))
+        if self.write_index(stat, head, postings, serials):
+            return head
+        return None
+
+    def merge(self, head, stat):
+        """
+          write the postings of the tasks added and the serials appended,
+        return the head then, None if it failed.
+        """
+        next, dead, count, appended, added, generations = head
+        serials = self.read_serials(generations[0])
+
+        if serials is None or not self.postings.open(generations[1]):
+            return None
+        try:
+            postings = dict(self.postings.items())
+        finally:
+            self.postings.close()
+
+        merged = {}
+        for serial, tokens in added:
+            for token in tokens:
+                merged.setdefault(token, array('l')).append(serial)
+        for token, packed in merged.iteritems():
+            postings[token] = postings.get(token, '') + packed.tostring()
+
+        serials.extend(appended)
+        generation = os.urandom(8)
+        head = (next, dead, len(serials), [], [], (generation, generation))
+        if self.write_index(stat, head, postings, serials):
+            return head
+        return None
+
+    def matching(self, tasks, strs, indexes):
+        """the indexes of the tasks having all the strs"""
+        return [index for index in indexes
+                if all(s in tasks[index].content for s in strs)]
+
+    def search(self, tasks, strs, stat):
+        """
+          return the positions (0 based, in order) of the tasks having all
+        the strs, tasks read from todo.txt with this stat. Tasks are
+        scanned if the index can't be written.
+        """
+        head = self.read_head(stat)
+
+        # the journal is appended before the index follows it, a crash in
+        # between leaves the index with more or fewer tasks: rebuild it
+        if head is not None and head[2] + len(head[3]) != len(tasks):
+            head = None
+
+        if head is not None and len(head[4]) > self.max_added:
+            head = self.merge(head, stat)
+
+        postings = self.postings
+        if head is None or not postings.open(head[5][1]):
+            head = self.build(tasks, stat)
+            if head is None or not postings.open(head[5][1]):
+                return self.matching(tasks, strs, xrange(len(tasks)))
+
+        candidates = None
+
+        try:
+            for token in set().union(*[self.tokens(s) for s in strs]):
+                matched = postings.lookup(token)
+                for serial, tokens in head[4]:
+                    if any(token in key for key in tokens):
+                        matched.add(serial)
+                if candidates is None:
+                    candidates = matched
+                else:
+                    candidates &= matched
+                if not candidates:
+                    return []
+        finally:
+            postings.close()
+
+        serials = self.read_serials(head[5][0])
+        if candidates is None or serials is None:  # no tokens to look up
+            return self.matching(tasks, strs, xrange(len(tasks)))
+
+        serials.extend(head[3])
+        indexes = []
+        for serial in sorted(candidates):
+            index = bisect.bisect_left(serials, serial)
+            if index < len(serials) and serials[index] == serial:
+                indexes.append(index)
+        return self.matching(tasks, strs, indexes)
+
+    def add(self, content, before, after):
+        """index a task of this content appended to todo.txt"""
+        head = self.read_head(before)
+
+        if head is not None:
+            next, dead, count, appended, added, generations = head
+            appended.append(next)
+            added.append((next, list(self.tokens(content))))
+            head = (next + 1, dead, count, appended, added, generations)
+            self.write_index(after, head)
+
+    def remove(self, indexes, before, after):
+        """
+          drop the tasks at indexes (0 based, sorted) removed from todo.txt.
+        Once more tasks were removed than are left, the index is removed,
+        for the next search to rebuild it without their postings.
+        """
+        head = self.read_head(before)
+
+        if head is None:
+            return
+
+        next, dead, count, appended, added, generations = head
+        serials = self.read_serials(generations[0])
+
+        if serials is not None:
+            serials.extend(appended)
+            kept = array('l')
+            last = 0
+            for index in list(indexes) + [len(serials)]:
+                kept += serials[last:index]
+                last = index + 1
+            dead += len(serials) - len(kept)
+            if dead <= len(kept):
+                head = (next, dead, len(kept), [], added,
+                        (os.urandom(8), generations[1]))
+                if self.write_index(after, head, serials=kept):
+                    return
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def clear(self, before, after):
+        """empty the index, all tasks cleared from todo.txt"""
+        if self.read_head(before) is not None:
+            generation = os.urandom(8)
+            head = (0, 0, 0, [], [], (generation, generation))
+            self.write_index(after, head, {}, array('l'))
+
+    def touch(self, before, after):
+        """stamp the index with after, if the write kept the contents"""
+        if self.identity(before) == self.identity(after):
+            return
+        head = self.read_head(before)
+
+        if head is not None:
+            self.write_index(after, head)
+
+
+class TodoJournal(File):
+    """
+      Write-ahead journal of the operations on todo.txt, in the file
+    '.todo.txt.journal' beside it.
+
+      Removing tasks, renaming the todo and checking tasks whose marks can't
+    be patched in place would rewrite todo.txt: they are appended to the
+    journal instead, as marshal records synced to disk, and readers replay
+    them over todo.txt. Adding or checking tasks compacts the journal, as
+    does having more than `threshold` records: the todo is written to
+    todo.txt, which is up to date again, and the journal is removed.
+
+      The journal starts with todo.txt's identity (see TodoCache). If it
+    doesn't match, todo.txt was edited by hand since: the records are still
+    replayed, each one finds its tasks by their contents, which it holds, if
+    they moved. A compaction closes the journal before todo.txt is replaced,
+    with the identity of the todo.txt written, so a journal left by a crash
+    after that is known to be in todo.txt already. Each record follows a
+    line of its size and crc32: a record cut by a crash is dropped, with
+    the records after it.
+
+      Records are ('check', indexes, done, contents), ('remove', indexes,
+    contents), ('name', name) and ('closed', identity).
+
+      attributes
+        path        str     the journal's filepath
+        end         int     the journal's size read, None if there's none
+        stale       bool    whether todo.txt was edited since the journal
+                            started
+      methods
+        read        return the records to replay on todo.txt
+        append      append a record, synced
+        close       mark the journal in the todo.txt written
+        remove      remove the journal, after a compaction
+    """
+
+    version = 1
+
+    threshold = 32
+
+    def __init__(self, txt_path):
+        self.txt_path = txt_path
+        head, tail = os.path.split(os.path.abspath(txt_path))
+        super(TodoJournal, self).__init__(
+            os.path.join(head, ".%s.journal" % tail))
+        self.end = None
+        self.count = 0  # the number of records read or appended
+        self.stale = False
+
+    def exists(self):
+        """is there a journal to replay"""
+        return os.path.exists(self.path)
+
+    def changed(self):
+        """has the journal changed since read"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = None
+        return size != self.end
+
+    def read(self, identity):
+        """
+          return the records to replay on todo.txt with this identity, []
+        if there's no journal, or it is closed in this todo.txt. A journal
+        which can't be read is a fatal error, its records are never dropped.
+        """
+        from binascii import crc32
+
+        self.end, self.count, self.stale = None, 0, False
+
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except IOError:
+            return []
+
+        records = []
+        end = 0
+
+        while True:  # until the end, or a record cut by a crash
+            newline = data.find("\n", end)
+            if newline < 0:
+                break
+            try:
+                size, crc = map(int, data[end:newline].split())
+            except ValueError:
+                break
+            record = data[newline + 1:newline + 1 + size]
+            if len(record) != size or crc32(record) & 0xffffffff != crc:
+                break
+            try:
+                records.append(marshal.loads(record))
+            except (EOFError, ValueError, TypeError):
+                break
+            end = newline + 1 + size
+
+        if not records or records[0][:1] != (self.version,):
+            log.error("Can't read the journal '%s' of todo.txt, move it "
+                      "away to use todo.txt without it." % self.path)
+
+        if ("closed", identity) in records:  # left by a crash, in todo.txt
+            try:
+                os.remove(self.path)
+            except OSError:  # removed by another reader already
+                pass
+            return []
+
+        self.stale = records.pop(0) != (self.version, identity)
+        records = [record for record in records if record[0] != "closed"]
+        self.end, self.count = end, len(records)
+        return records
+
+    def frame(self, record):
+        """a record as written: its size and crc32, then its marshal data"""
+        from binascii import crc32
+
+        data = marshal.dumps(record)
+        return "%d %d\n%s" % (len(data), crc32(data) & 0xffffffff, data)
+
+    def append(self, record, identity):
+        """
+          append a record and sync it, starting the journal of todo.txt with
+        this identity if there's none. Records cut by a crash are dropped
+        first. The journal must have been read.
+        """
+        data = self.frame(record)
+
+        if self.end is None:  # never a journal without its header
+            data = self.frame((self.version, identity)) + data
+            self.replace(lambda f: f.write(data),
+                         mode=os.stat(self.txt_path).st_mode)
+            self.end = 0
+        else:
+            fd = os.open(self.path, os.O_WRONLY)
+            try:
+                os.ftruncate(fd, self.end)
+                os.lseek(fd, self.end, os.SEEK_SET)
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+        self.end += len(data)
+        self.count += 1
+
+    def close(self, identity):
+        """
+          append the record closing the journal, synced, once the todo.txt
+        with its records applied is written with this identity, and before
+        it replaces todo.txt. Nothing is done if there's no journal read.
+        """
+        if self.end is not None:
+            self.append(("closed", identity), None)
+
+    def remove(self):
+        """remove the journal, its records are in todo.txt"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.end, self.count, self.stale = None, 0, False
+
+
+class TodoLock(File):
+    """
+      Advisory lock of todo.txt, on a file in '~/.todo/locks/' named after
+    todo.txt's real path, like the cache: todo.txt is replaced when written,
+    so it can't be locked itself, and a lock file beside it would be left
+    in every directory a todo.txt is read in.
+
+      Commands changing the todo hold it exclusively, from loading the todo
+    to writing it, so concurrent commands don't lose each other's updates.
+    Readers hold it shared while reading todo.txt and its journal, so they
+    never read one without the other. Nested acquisitions only count, they
+    keep the outer lock. Without fcntl, or if the lock file can't be
+    opened, nothing is locked.
+
+      attributes
+        path        str     the lock's filepath
+        depth       int     the number of acquisitions held
+      methods
+        acquire     acquire the lock, shared or exclusive, blocking
+        release     release an acquisition
+    """
+
+    def __init__(self, txt_path):
+        self.lock_dir = os.path.join(self.home, ".todo", "locks")
+        filename = os.path.realpath(txt_path).replace(os.sep, "%")
+        super(TodoLock, self).__init__(os.path.join(self.lock_dir, filename))
+        self.fd = None
+        self.depth = 0
+
+    def acquire(self, exclusive=False):
+        """acquire the lock, wait for the processes holding it"""
+        if self.depth == 0 and fcntl is not None:
+            if not os.path.exists(self.lock_dir):
+                try:
+                    os.makedirs(self.lock_dir)
+                except OSError:  # made by another process, or can't be
+                    pass
+            try:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            except OSError:
+                self.fd = None
+            if self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_EX if exclusive else
+                            fcntl.LOCK_SH)
+        self.depth += 1
+
+    def release(self):
+        """release an acquisition, the lock once all are released"""
+        self.depth -= 1
+        if self.depth == 0 and self.fd is not None:
+            os.close(self.fd)  # unlocks it
+            self.fd = None
 
 
 class Gist(File):
@@ -227,10 +1274,12 @@ class GistId(Gist):
         self.path = os.path.join(self.todo_dir, self.name)
         self.read()  # must read after know his path
 
-    def get(self, answer=None):  # add answer to figure which approach to go
+    def get(self, answer=None, name=None, content=None):
         """
         call this method to get a gist_id::
             gist_id = GistId().get()
+        answer figures which approach to go, a new gist is created with the
+        file name and content given, by default todo.txt's, read as is.
         what the get() dose:
           1) read the gist_id from file "~/.todo/gist_id"
           2) check if the gist_id if empty
@@ -250,12 +1299,12 @@ class GistId(Gist):
                 self.save(ask_input.text("Gist id:"))
             elif answer == '1':
                 # new a gist
-                todo_content = TodoTxt().read()
-                todo = parser.parse(todo_content)
-                if not todo.name:
+                if content is None:
+                    content = TodoTxt().read()
+                    name = parser.parse(content).name
+                todo_content = content
+                if not name:
                     name = "Todo"
-                else:
-                    name = todo.name
 
                 files = {
                     name: {
@@ -277,12 +1326,13 @@ class GistId(Gist):
                     log.ok("Create success:%s ,"
                            "pushed at file '%s'" % (html_url, name))
                     self.save(dct["id"])
+                    PushedHashes().set(dct["id"], name, todo_content)
                     sys.exit()
                 elif resp.status_code == 401:
                     log.warning("Github access denied, empty the old token")
                     GithubToken().save('')  # empty the token!
                     # and re create
-                    self.get(answer='1')
+                    self.get('1', name, content)
                 else:
                     log.error("Create gist failed. %d" % resp.status_code)
             else:  # exit if else input
@@ -290,6 +1340,163 @@ class GistId(Gist):
         return self.content
 
 
+class PushedHashes(Gist):
+    """
+      Hashes of the contents last pushed to gists, in '~/.todo/pushed', a
+    line 'gist_id<tab>sha1<tab>file name' per gist file.
+
+      methods
+        get     return the hash of the content last pushed to a gist file
+        set     record the content pushed to a gist file
+    """
+
+    def __init__(self):
+        super(PushedHashes, self).__init__()
+        self.name = "pushed"
+        self.path = os.path.join(self.todo_dir, self.name)
+        self.read()
+
+    def hash(self, content):
+        """the hash of a content"""
+        import hashlib
+        return hashlib.sha1(content).hexdigest()
+
+    def hashes(self):
+        """return {(gist_id, file name): hash}"""
+        hashes = {}
+        for line in (self.content or "").splitlines():
+            gist_id, digest, name = line.split("\t", 2)
+            hashes[gist_id, name] = digest
+        return hashes
+
+    def get(self, gist_id, name):
+        """return the hash last pushed to the gist's file, None if none"""
+        return self.hashes().get((gist_id, name))
+
+    def set(self, gist_id, name, content):
+        """record the content as the gist file's, failures are ignored"""
+        hashes = self.hashes()
+        hashes[gist_id, name] = self.hash(content)
+        self.content = "\n".join("\t".join((gist_id, digest, name))
+                                 for (gist_id, name), digest
+                                 in sorted(hashes.items()))
+        try:
+            self.write(self.content)
+        except (IOError, OSError):
+            pass
+
+
+class PulledGist(File):
+    """
+      The gist last pulled, in '~/.todo/cache/gist.<gist_id>': its etag,
+    and its files' contents and raw urls, with marshal. A pull sends the
+    etag, an unchanged gist is answered 304 without a body, its files are
+    read from here.
+
+      attributes
+        etag        str     the etag of the gist's response, or None
+        files       dict    {file name: [content or None, raw_url]}, the
+                            content is None if it was truncated, and not
+                            fetched yet
+      methods
+        fetch       fetch the gist if changed, return files' contents
+        save        store the etag and files, failures are ignored
+    """
+
+    def __init__(self, gist_id):
+        self.gist_id = gist_id
+        cache_dir = os.path.join(self.home, ".todo", "cache")
+        super(PulledGist, self).__init__(
+            os.path.join(cache_dir, "gist." + gist_id))
+        try:
+            with open(self.path, "rb") as f:
+                self.etag, self.files = marshal.load(f)
+        except (IOError, EOFError, ValueError, TypeError):
+            self.etag, self.files = None, {}
+
+    def save(self):
+        """write the etag and files"""
+        try:
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            self.replace(lambda f: marshal.dump((self.etag, self.files), f),
+                         sync=False)
+        except (IOError, OSError):
+            pass
+
+    def fetch(self, github, u_names):
+        """
+          Fetch the gist with <Github instance>, conditionally, and return
+        the contents of its files u_names (unicode), None for a file not in
+        it. Files truncated in the gist's response are fetched apart. Raise
+        GistError if the gist or a file can't be fetched.
+        """
+        resp = github.get_gist(self.gist_id, self.etag)
+
+        if resp.status_code == 200:
+            dct = resp.json()  # get out the data
+            # Note that data back from github.com is unicode
+            self.etag = resp.headers.get("etag")
+            self.files = dict(
+                (u_name, [None if f.get("truncated") else f.get("content"),
+                          f["raw_url"]])
+                for u_name, f in dct["files"].items())
+            self.save()
+        elif resp.status_code != 304:  # 304: unchanged since the last pull
+            raise GistError("Pull failed.%d" % resp.status_code)
+
+        u_contents = []
+
+        for u_name in u_names:
+            if u_name not in self.files:
+                u_contents.append(None)
+                continue
+
+            u_content, u_url = self.files[u_name]
+
+            if u_content is None:  # truncated in the gist's response
+                url = u_url.encode("utf8")
+                response = github.request("GET", url)
+
+                if response.status_code != 200:
+                    raise GistError("Failed to pull file from %s" % url)
+                u_content = self.files[u_name][0] = response.text
+                self.save()
+            u_contents.append(u_content)
+        return u_contents
+
+
+def mutation(method):
+    """
+      Decorator of the App methods changing the todo. They run holding
+    todo.txt's lock exclusively, against the todo.txt as it is then: a todo
+    loaded before and changed since is loaded again. Since hand edits don't
+    take the lock, the todo.txt is checked unchanged again when written,
+    else TodoChanged is raised and the method retried on the fresh todo.
+    """
+    def wrapper(self, *args, **kwargs):
+        lock = self.todo_lock
+
+        if lock.depth:  # called by a mutation, which retries
+            return method(self, *args, **kwargs)
+
+        lock.acquire(exclusive=True)
+        try:
+            for retry in xrange(self.retries, -1, -1):
+                self.refresh()
+                try:
+                    return method(self, *args, **kwargs)
+                except TodoChanged:
+                    self._todo = None
+                    if not retry:
+                        log.error("todo.txt keeps changing, try again.")
+        finally:
+            lock.release()
+
+    wrapper.__name__, wrapper.__doc__ = method.__name__, method.__doc__
+    return wrapper
+
+
 class App(object):
     """
       Todo command line application.
@@ -300,37 +1507,207 @@ class App(object):
 
     """
 
-    def __init__(self):
-        self.todo_txt = t = TodoTxt()  # <TodoTxt instance>
-        self.todo_content = c = t.read()  # todo.txt's content
-        self.todo = parser.parse(c)  # <Todo instance>
+    retries = 3  # times a mutation is retried if todo.txt changes under it
+
+    ids_pattern = re.compile(r"^{0}(,{0})*$".format(
+        r"(\d+(-\d+)?|-?\d*:-?\d*(:-?\d*)?)"))
+
+    def __init__(self, path=None):
+        """the app of todo.txt at path, by default the one TodoTxt uses"""
+        self.todo_txt = t = TodoTxt(path)  # <TodoTxt instance>
+        self.todo_cache = TodoCache(t.path)  # <TodoCache instance>
+        self.todo_index = TodoIndex(t.path)  # <TodoIndex instance>
+        self.todo_journal = TodoJournal(t.path)  # <TodoJournal instance>
+        self.todo_lock = TodoLock(t.path)  # <TodoLock instance>
+        self._todo = None
+        self._todo_stat = None  # todo.txt's stat when the todo was loaded
 
-    def generate_to_txt(func):
+    @property
+    def todo(self):
         """
-          Decorator, generate <Todo instance> to str, and then
-        save to todo.txt.
+          <Todo instance>, loaded on first use, from cache if possible, with
+        the operations in the journal replayed. todo.txt and the journal are
+        read holding the lock shared.
         """
-        def wrapper(self, *args, **kwargs):
-            func(self, *args, **kwargs)
-            self.todo_txt.write(generator.generate(self.todo))
-        return wrapper
+        if self._todo is None:
+            self.todo_lock.acquire()
+            try:
+                self.load()
+            finally:
+                self.todo_lock.release()
+        return self._todo
+
+    def load(self):
+        """load the todo, see todo"""
+        cache = self.todo_cache
+        data, stat = self.todo_txt.map()
+        self._todo = cache.load(data, stat)
+        self._todo_stat = stat
+
+        if self._todo is None:  # todo.txt changed, parse and cache it
+            columns = cache.save(data, stat)
+
+            if columns is None:  # syntax errors, the parser raises
+                pos, endpos = scanner.bounds(data)
+                self._todo = parser.parse(data[pos:endpos])
+            else:
+                self._todo = scanner.store(data, columns)
 
-    def wrap_task(self, task, index=None):
-        """wrap task to colored str"""
-        if task.done:
-            state = colored('✓', 'green')
-        else:
-            state = colored('✖', "red")
+        for record in self.todo_journal.read(cache.identity(stat)):
+            self.replay(record)
 
-        content = colored(task.content, "gray")
-        wrapped_task = state + "  " + content
-        if index:
-            wrapped_task = colored(str(index)+'.', 'gray') + ' ' + wrapped_task
-        return wrapped_task
+    def refresh(self):
+        """
+          let go the todo if its todo.txt or its journal changed since
+        loaded.
+        """
+        if self._todo is not None:
+            cache = self.todo_cache
+            try:
+                changed = (cache.identity(cache.stat()) !=
+                           cache.identity(self._todo_stat))
+            except OSError:
+                changed = True
+            if changed or self.todo_journal.changed():
+                self._todo = None
+
+    def loaded_from(self, stat):
+        """is the todo loaded from todo.txt with this stat"""
+        cache = self.todo_cache
+        return (self._todo is not None and
+                cache.identity(stat) == cache.identity(self._todo_stat))
+
+    def check_unchanged(self, stat):
+        """raise TodoChanged if the todo isn't loaded from todo.txt's stat"""
+        if not self.loaded_from(stat):
+            raise TodoChanged(self.todo_txt.path)
+
+    def replay(self, record):
+        """apply an operation recorded in the journal to the todo"""
+        op, args = record[0], record[1:]
+        todo = self._todo
+
+        if op == "check":
+            indexes, done, contents = args
+            for index in self.match(indexes, contents):
+                todo.tasks[index].done = done
+        elif op == "remove":
+            indexes, contents = args
+            todo.tasks.remove_all(self.match(indexes, contents))
+        elif op == "name":
+            todo.name = args[0]
+
+    def match(self, indexes, contents):
+        """
+          return the sorted indexes of the tasks of these contents, recorded
+        at these indexes. A task which isn't at its index any more, todo.txt
+        was edited by hand, is the first other task of its content, if any,
+        looked up in a map of the contents built once.
+        """
+        tasks = self._todo.tasks
+        matched = set()
+        moved = []
+
+        for index, content in zip(indexes, contents):
+            if (index not in matched and index < len(tasks) and
+                    tasks[index].content == content):
+                matched.add(index)
+            else:
+                moved.append(content)
+
+        if moved:
+            others = {}  # content => indexes not matched, the last first
+            for index in xrange(len(tasks) - 1, -1, -1):
+                if index not in matched:
+                    others.setdefault(tasks[index].content, []).append(index)
+            for content in moved:
+                if others.get(content):
+                    matched.add(others[content].pop())
+        return sorted(matched)
+
+    def journal(self, op, *args):
+        """
+          Apply an operation to the todo and append it to the journal, with
+        the contents of the tasks at its indexes. The search index follows
+        it, still stamped with todo.txt's identity. The journal is compacted
+        first if todo.txt was edited since it started, and when it is over
+        its threshold.
+        """
+        self.todo  # loaded, with the journal replayed
+        if self.todo_journal.stale:
+            self.write_todo()
+
+        tasks = self.todo.tasks
+        stat = self._todo_stat
+        self.check_unchanged(self.todo_cache.stat())
+
+        if op in ("check", "remove"):
+            args += ([tasks[index].content for index in args[0]],)
+        record = (op,) + args
+        self.replay(record)
+        self.todo_journal.append(record, self.todo_cache.identity(stat))
+
+        if op == "remove":
+            self.todo_index.remove(args[0], stat, stat)
+
+        if self.todo_journal.count > self.todo_journal.threshold:
+            self.write_todo()
+
+    def closing(self):
+        """
+          return the synced function of File.write_chunks closing the
+        journal in the todo.txt written, see TodoJournal.close, None if no
+        journal was read.
+        """
+        if self.todo_journal.end is None:
+            return None
+        return lambda stat: self.todo_journal.close(
+            self.todo_cache.identity(stat))
 
-    def wrap_todo_name(self, underline=False):
-        """wrap todo's name"""
-        name = self.todo.name
+    def write_todo(self, reindex=None):
+        """
+          generate <Todo instance> to todo.txt, streamed by chunks, and
+        refresh the cache from the file written. The journal, if any, is
+        compacted into it. The search index follows with reindex(before,
+        after), given todo.txt's stats around the write, by default the
+        contents are kept. Raise TodoChanged if todo.txt changed since the
+        todo was loaded.
+        """
+        todo = self.todo
+        before = self.todo_cache.stat()
+        self.check_unchanged(before)
+        self.todo_txt.write_chunks(generator.generate_chunks(todo),
+                                   self.closing())
+        self.todo_journal.remove()
+        data, after = self.todo_txt.map()
+        self.todo_cache.save(data, after)
+        (reindex or self.todo_index.touch)(before, after)
+        # the todo's buffer may be the mapped todo.txt, which is rewritten,
+        # so let it go, it is loaded again from the cache if needed
+        self._todo = None
+
+    def task_templates(self, ids=True, prefix="", suffix=""):
+        """
+          return {done: template} of the tasks' lines, between prefix and
+        suffix, to format by % (id, content), or % content if not ids. The
+        colors are formatted once, not per task, so many tasks are wrapped
+        fast.
+        """
+        gray, end = color.codes("gray")
+        templates = {}
+        for done, state in ((True, colored('✓', 'green')),
+                            (False, colored('✖', "red"))):
+            template = state + "  " + gray + "%s" + end
+            if ids:
+                template = gray + "%d." + end + " " + template
+            templates[done] = (prefix.replace("%", "%%") + template +
+                               suffix.replace("%", "%%"))
+        return templates
+
+    def wrap_todo_name(self, underline=False, name=None):
+        """wrap todo's name, or the name given"""
+        if name is None:
+            name = self.todo.name
         if name:
             wrapped_name = colored(name, 'orange')
             if underline:
@@ -338,19 +1715,99 @@ class App(object):
             return wrapped_name
         return None
 
-    def ls_tasks(self, header=True, filter=lambda task: 1):
-        """ls tasks by filter. The filter's default: lambda task:1"""
+    def iter_todo(self):
+        """
+          Yield todo's name and tasks in order. Unless the todo is loaded
+        already, or has a journal to replay, they are streamed from todo.txt,
+        so listing a huge todo starts at once and runs in flat memory.
+        """
+        f = None
+
+        if self._todo is None:
+            self.todo_lock.acquire()
+            try:  # todo.txt is replaced when written, f reads it as is
+                if not self.todo_journal.exists():
+                    f = open(self.todo_txt.path)
+            finally:
+                self.todo_lock.release()
+
+        if f is not None:
+            with f:
+                for item in parser.iter_tasks(f):
+                    yield item
+        else:
+            todo = self.todo
+            yield todo.name
+            for task in todo.tasks:
+                yield task
 
+    def ls_tasks(self, header=True, filter=None, offset=0, limit=None):
+        """
+          ls tasks by filter, all if None, skipping the first offset tasks
+        it keeps and printing limit tasks at most. The todo is streamed, so
+        it is read no further than the last task printed. They are written
+        by a buffered <Output>, paged if TODO_PAGER is set.
+        """
+        templates = self.task_templates(suffix="\n")
+        stop = None if limit is None else offset + limit
+
+        def lines():
+            index = matched = 0
+            for item in self.iter_todo():
+                if not isinstance(item, basestring):  # a task, not the name
+                    if matched == stop:
+                        return
+                    index += 1
+                    if filter is None or filter(item):
+                        matched += 1
+                        if matched > offset:
+                            yield templates[item.done] % (index, item.content)
+                elif header:
+                    wrapped_name = self.wrap_todo_name(underline=True,
+                                                       name=item)
+                    if wrapped_name:
+                        yield wrapped_name + "\n"
+
+        output = Output(page=True)
+        output.writelines(lines())
+        output.close()
+
+    def tail_tasks(self, count, header=True, filter=None):
+        """
+          ls the last count tasks by filter, all if None. They are looked
+        up backwards from the todo's end: loaded from its cache, the tasks
+        before them aren't read at all.
+        """
         tasks = self.todo.tasks
+        indexes = []
+        index = len(tasks)
+
+        while index and len(indexes) < count:
+            index -= 1
+            if filter is None or filter(tasks[index]):
+                indexes.append(index)
+        indexes.reverse()
+
+        name = self.wrap_todo_name(underline=True) if header else None
+        self.print_indexes(tasks, indexes, name)
 
-        wrapped_name = self.wrap_todo_name(underline=True)
+    def print_indexes(self, tasks, indexes, name=None):
+        """
+          print tasks[index] for the indexes, with their ids, after the name
+        if any, by an <Output>
+        """
+        templates = self.task_templates(suffix="\n")
 
-        if header and wrapped_name:
-            print wrapped_name
+        def lines():
+            if name:
+                yield name + "\n"
+            for index in indexes:
+                task = tasks[index]
+                yield templates[task.done] % (index + 1, task.content)
 
-        for index, task in enumerate(tasks, 1):
-            if filter(task):
-                print self.wrap_task(task, index)
+        output = Output(page=True)
+        output.writelines(lines())
+        output.close()
 
     def print_todo_name(self):
         """print todo's name to screen"""
@@ -358,81 +1815,270 @@ class App(object):
         if name:
             print name
 
-    @generate_to_txt
+    @mutation
     def set_todo_name(self, new_name):
         """set todo's name a new one"""
-        self.todo.name = new_name
+        self.journal("name", new_name)
 
-    def get_task_by_id(self, index):
-        """return task object by its index, if not found, fatal error."""
-        index -= 1
-        tasks = self.todo.tasks
-        if index >= len(tasks):
+    def parse_ids(self, ids):
+        """
+          parse task ids: an id '3', a range '3-400', a python slice of the
+        tasks ':-10' or '::2', or a list of them '1,5,9'. Return the ids
+        sorted without duplicates, None if it isn't ids.
+        """
+        if not self.ids_pattern.match(ids):
+            return None
+
+        result = set()
+
+        for part in ids.split(","):
+            if ":" in part:
+                bounds = [int(bound) if bound else None
+                          for bound in part.split(":")]
+                try:
+                    indices = slice(*bounds).indices(len(self.todo.tasks))
+                except ValueError:  # slice step cannot be zero
+                    log.error("Invalid slice '%s'." % part)
+                result.update(index + 1 for index in xrange(*indices))
+            elif "-" in part:
+                first, last = map(int, part.split("-"))
+                if first > last:
+                    log.error("Invalid range '%s'." % part)
+                result.update(xrange(first, last + 1))
+            else:
+                result.add(int(part))
+        return sorted(result)
+
+    def get_task_indexes(self, ids):
+        """return the tasks' indexes by their sorted ids, fatal error if one
+        is not found, or if there are none (an empty slice)."""
+        if not ids or not 1 <= ids[0] <= ids[-1] <= len(self.todo.tasks):
             log.error("Task not found.")
-        return tasks[index]
+        return [id - 1 for id in ids]
 
-    def print_task(self, index):
-        """Print wrapped task to term by its id"""
-        task = self.get_task_by_id(index)
-        print self.wrap_task(task, index)
+    def print_tasks(self, ids):
+        """Print wrapped tasks to term by their sorted ids"""
+        self.print_indexes(self.todo.tasks, self.get_task_indexes(ids))
 
-    @generate_to_txt
     def check_task(self, index, is_done=True):
-        """check a task to done or undone"""
-        task = self.get_task_by_id(index)
-        task.done = True if is_done else False
+        """check a task to done or undone, see check_tasks"""
+        self.check_tasks([index], is_done)
+
+    @mutation
+    def check_tasks(self, ids, is_done=True):
+        """
+          check tasks by their sorted ids to done or undone. Patched in
+        todo.txt in place if there's no journal, the todo is loaded and
+        cached first if the cache missed. A journal is compacted with the
+        tasks checked, and marks which can't be patched are journaled.
+        Nothing is written if nothing changes.
+        """
+        is_done = True if is_done else False
+        indexes = [id - 1 for id in ids]
+        before = self.todo_cache.stat()
+        patched = False
+
+        if indexes and not self.todo_journal.exists():
+            patched = self.todo_cache.check(self.todo_txt, indexes, is_done)
+            if not patched and self._todo is None:  # loading caches it
+                self.todo
+                patched = self.todo_cache.check(self.todo_txt, indexes,
+                                                is_done)
+
+        if patched:
+            after = self.todo_cache.stat()
+            self.todo_index.touch(before, after)
+            if self.loaded_from(before):
+                tasks = self._todo.tasks
+                for index in indexes:
+                    tasks[index].done = is_done
+                self._todo_stat = after
+            else:
+                self._todo = None
+            return
+
+        tasks = self.todo.tasks
+        indexes = [index for index in self.get_task_indexes(ids)
+                   if tasks[index].done != is_done]
+
+        if not indexes:
+            return
+        if self.todo_journal.exists():
+            for index in indexes:
+                tasks[index].done = is_done
+            self.write_todo()
+        else:
+            self.journal("check", indexes, is_done)
 
-    @generate_to_txt
     def remove_task(self, index):
         """remove a task from list"""
-        task = self.get_task_by_id(index)
-        self.todo.tasks.remove(task)
+        self.remove_tasks([index])
 
-    @generate_to_txt
+    @mutation
+    def remove_tasks(self, ids):
+        """remove tasks by their sorted ids in one pass, journaled"""
+        indexes = self.get_task_indexes(ids)
+        if indexes:
+            self.journal("remove", indexes)
+
+    @mutation
     def add_task(self, content):
-        """add a new task"""
-        self.todo.tasks.append(Task(content))
+        """
+          add a new task, appended to todo.txt without parsing it. If there's
+        a journal, it is compacted with the task added instead.
+        """
+        task = Task(content)
+
+        if self.todo_journal.exists():
+            self.todo.tasks.append(task)
+            return self.write_todo(
+                lambda before, after: self.todo_index.add(content, before,
+                                                          after))
+
+        line = generator.generate_task(task)
+        before = self.todo_cache.stat()
+        offset = self.todo_txt.append(line)
+        after = self.todo_cache.stat()
+        self.todo_cache.append(offset, line, before, after)
+        self.todo_index.add(content, before, after)
+        if self.loaded_from(before):
+            self._todo.tasks.append(task)
+            self._todo_stat = after
+        else:
+            self._todo = None
 
-    @generate_to_txt
+    @mutation
     def clear_tasks(self):
         """clear all tasks"""
         self.todo.tasks = []
+        self.write_todo(self.todo_index.clear)
 
-    def push(self):
-        """Push todo to gist.github.com"""
-        github = Github()
-        gist_id = GistId().get()
-        token = GithubToken().get()
+    def search_tasks(self, strs, offset=0, limit=None, tail=None):
+        """
+          print the tasks having all the strs, looked up in the index: the
+        last tail of them if tail, else limit of them at most after the
+        first offset.
+        """
+        tasks = self.todo.tasks
+        indexes = self.todo_index.search(tasks, strs, self._todo_stat)
+        if tail is not None:
+            indexes = indexes[-tail:] if tail else []
+        else:
+            indexes = indexes[offset:]
+            if limit is not None:
+                indexes = indexes[:limit]
+        self.print_indexes(tasks, indexes)
 
-        github.login(token)
+    @mutation
+    def batch(self, lines):
+        """
+          Apply operations, a list of lines, to the todo and write it once.
+        Ids are the tasks' ids before the batch, tasks added get the ids
+        following them, so removing a task doesn't shift the ids of later
+        operations. On an error nothing is written.
+        """
+        tasks = list(self.todo.tasks)  # ids are fixed during the batch
+        removed = set()
+        added = 0
+
+        for lineno, line in enumerate(lines, 1):
+            op, _, arg = line.strip().partition(" ")
+            arg = arg.strip()
+
+            if not op or op.startswith("#"):
+                continue
+            elif op == "add" and arg:
+                tasks.append(Task(arg))
+                added += 1
+            elif op == "name" and arg:
+                self.todo.name = arg
+            elif op in ("done", "undone", "remove"):
+                try:
+                    index = int(arg) - 1
+                except ValueError:
+                    log.error("Line %d: invalid id '%s'." % (lineno, arg))
+                if not 0 <= index < len(tasks) or index in removed:
+                    log.error("Line %d: task %s not found." % (lineno, arg))
+                if op == "remove":
+                    removed.add(index)
+                else:
+                    tasks[index].done = op == "done"
+            else:
+                log.error("Line %d: invalid operation '%s'." % (
+                    lineno, line.strip()))
+
+        if removed:
+            tasks = [task for index, task in enumerate(tasks)
+                     if index not in removed]
+
+        self.todo.tasks = tasks
+
+        if added or removed:  # the index is rebuilt by the next search
+            self.write_todo(lambda before, after: None)
+        else:
+            self.write_todo()
+
+    @mutation
+    def compact(self):
+        """compact the journal, if any, into todo.txt"""
+        if self.todo_journal.exists():
+            self.write_todo()
+
+    def push(self, force=False):
+        """
+          Push todo to gist.github.com. Skipped if todo.txt is the same as
+        last pushed to the gist's file, unless forced.
+        """
+        self.compact()  # push todo.txt up to date, a new gist's too
 
         if not self.todo.name:
             name = "Todo"
         else:
             name = self.todo.name
 
+        content = self.todo_txt.read()
+        gist_id = GistId().get(name=name, content=content)
+        pushed = PushedHashes()
+
+        if not force and pushed.get(gist_id, name) == pushed.hash(content):
+            log.ok("Nothing changed since the last push to '%s', "
+                   "use --force to push anyway." % name)
+            return
+
+        github = Github()
+
         files = {
             name: {
-                "content": self.todo_content
+                "content": content
             }
         }
 
         log.info(
             "Pushing '%s' to https://gist.github.com/%s .." % (name, gist_id)
         )
-        response = github.edit_gist(gist_id, files=files)
 
-        if response.status_code == 200:
-            log.ok("Pushed success.")
-        elif response.status_code == 401:
+        for retry in xrange(2):  # pushed again once, with a new token
+            github.login(GithubToken().get())
+            response = github.edit_gist(gist_id, files=files)
+
+            if response.status_code != 401 or retry:
+                break
             log.warning("Github token out of date, empty the old token")
             GithubToken().save('')  # empty the token!
-            self.push()  # and repush
+
+        if response.status_code == 200:
+            pushed.set(gist_id, name, content)
+            log.ok("Pushed success.")
         else:
             log.error("Pushed failed. %d" % response.status_code)
 
     def pull(self, name=None):
-        """Pull todo from remote gist server"""
+        """
+          Pull todo from remote gist server. The gist is fetched
+        conditionally with the etag of the last pull, and its file's content
+        is taken from the gist's response, fetched apart only if truncated.
+        todo.txt is not written if it is the same already.
+        """
 
         if not name:  # if not name figured out
             if self.todo.name:
@@ -443,30 +2089,43 @@ class App(object):
         github = Github()
         gist_id = GistId().get()
 
-        resp = github.get_gist(gist_id)
-
-        if resp.status_code != 200:
-            log.error("Pull failed.%d" % resp.status_code)
-
-        dct = resp.json()  # get out the data
-
         u_name = name.decode("utf8")  # decode to unicode
 
-        # Note that data back from github.com is unicode
-        if u_name not in dct["files"]:
-            log.error("File '%s' not in gist: %s" % (name, gist_id))
+        try:
+            u_content, = PulledGist(gist_id).fetch(github, [u_name])
+        except GistError as error:
+            log.error(str(error))
 
-        u_url = dct["files"][u_name]["raw_url"]
-        url = u_url.encode("utf8")
+        if u_content is None:
+            log.error("File '%s' not in gist: %s" % (name, gist_id))
 
-        response = requests.get(url)
+        todo_content = u_content.encode("utf8").strip()
 
-        if response.status_code == 200:
-            todo_content = response.text.encode("utf8")
-            self.todo_txt.write(todo_content)
+        if self.replace_todo(todo_content):
             log.ok("Pulled success to file '%s'" % self.todo_txt.path)
         else:
-            log.error("Failed to pull file from %s" % url)
+            log.ok("File '%s' is up to date." % self.todo_txt.path)
+        # the gist's file is todo.txt's content, no need to push it back
+        PushedHashes().set(gist_id, name, todo_content)
+
+    def replace_todo(self, content):
+        """
+          replace todo.txt and its journal with the content, unless it is
+        the same already. Return whether it was replaced.
+        """
+        self.todo_lock.acquire(exclusive=True)
+        try:
+            journal = self.todo_journal
+            if journal.exists() or self.todo_txt.read() != content:
+                cache = self.todo_cache
+                journal.read(cache.identity(cache.stat()))  # to close it
+                self.todo_txt.write_chunks((content,), self.closing())
+                journal.remove()
+                self._todo = None
+                return True
+            return False
+        finally:
+            self.todo_lock.release()
 
     def set_gist_id(self, new_gist_id):
         """set gist_id"""
@@ -482,9 +2141,18 @@ class App(object):
 
     def run(self):
 
+        if len(sys.argv) == 1:
+            # plain 'todo' is often run from shell prompts, list undone
+            # tasks without loading docopt.
+            return self.ls_tasks(filter=lambda task: not task.done)
+
+        from docopt import docopt
         args = docopt(__doc__, version="todo version: " + __version__)
 
-        if args["clear"]:
+        if args["workspace"]:
+            from workspace import Workspace
+            Workspace(args["--dir"]).ls(args["<str>"], args["--all"])
+        elif args["clear"]:
             self.clear_tasks()
         elif args["name"]:
             if args["<new_name>"]:
@@ -492,39 +2160,67 @@ class App(object):
             else:
                 self.print_todo_name()
         elif args["search"]:
-            self.ls_tasks(
-                header=False, filter=lambda task: args["<str>"] in task.content
-            )
+            self.search_tasks(args["<str>"], **self.window(args))
+        elif args["serve"]:
+            from server import Server
+            Server().serve()
+        elif args["batch"]:
+            if args["<file>"] in (None, "-"):
+                self.batch(sys.stdin.readlines())
+            else:
+                with open(args["<file>"]) as f:
+                    self.batch(f.readlines())
+        elif args["sync"]:
+            from sync import Sync
+            if args["push"]:
+                Sync().push(args["--force"])
+            else:
+                Sync().pull()
         elif args["pull"]:
             self.pull(args["<name>"])
         elif args["push"]:
-            self.push()
+            self.push(args["--force"])
         elif args["gist_id"]:
             if args["<new_gist_id>"]:
                 self.set_gist_id(args["<new_gist_id>"])
             else:
                 self.get_gist_id()
         elif args["<id>"]:
-            try:
-                task_id = int(args["<id>"])
-            except ValueError:
-                # not an integer, add as a task
+            task_ids = self.parse_ids(args["<id>"])
+
+            if task_ids is None:
+                # not ids, add as a task
                 self.add_task(args["<id>"])
+            elif args["done"]:
+                self.check_tasks(task_ids, True)
+            elif args["undone"]:
+                self.check_tasks(task_ids, False)
+            elif args["remove"]:
+                self.remove_tasks(task_ids)
             else:
-                if args["done"]:
-                    self.check_task(task_id, True)
-                elif args["undone"]:
-                    self.check_task(task_id, False)
-                elif args["remove"]:
-                    self.remove_task(task_id)
-                else:
-                    self.print_task(task_id)
+                self.print_tasks(task_ids)
         elif args["<task>"]:
             self.add_task(" ".join(args["<task>"]))
-        elif args["--all"]:
-            self.ls_tasks()
         else:
-            self.ls_tasks(filter=lambda task: not task.done)
+            window = self.window(args)
+            filter = None if args["--all"] else lambda task: not task.done
+            if "tail" in window:
+                self.tail_tasks(window["tail"], filter=filter)
+            else:
+                self.ls_tasks(filter=filter, **window)
+
+    def window(self, args):
+        """
+          return the keyword arguments of the window of tasks to print, as
+        set by --offset, --limit and --tail
+        """
+        window = {}
+        for option in ("--offset", "--limit", "--tail"):
+            if args[option] is not None:
+                if not args[option].isdigit():
+                    log.error("%s takes a number of tasks." % option)
+                window[option[2:]] = int(args[option])
+        return window
 
 
 def main():
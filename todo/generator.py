@@ -16,15 +16,18 @@
   Generator from <Todo instance> to string::
 
       generator.generate(<Todo instance>)  # return str
+      generator.generate_chunks(<Todo instance>)  # yield str chunks
 """
 
 from models import Task
 from models import Todo
 
+from itertools import islice
+
 
 class Generator(object):
     """
-      Generator from <Todo instance> to string.
+      Generator from <Todo instance> to string, whole or streamed by chunks.
     """
 
     newline = '\n'
@@ -41,9 +44,19 @@ class Generator(object):
               '- [x] Go shopping'
 
         """
-        done = '[x]' if task.done else '   '
-        content = task.content
-        return ' '.join(['-', done, content])
+        return ('- [x] ' if task.done else '-     ') + task.content
+
+    def generate_lines(self, todo):
+        """
+          yield the lines of <Todo instance>, without newlines
+        """
+        if todo.name:
+            yield todo.name
+            yield max(len(todo.name), 3) * '-'
+
+        generate_task = self.generate_task
+        for task in todo.tasks:
+            yield generate_task(task)
 
     def generate_todo(self, todo):
         """
@@ -51,21 +64,24 @@ class Generator(object):
           parameters
             todo   the <Todo instance>
         """
-        lines = []
-
-        if todo.name:
-            lines.append(todo.name)
-            name_len = len(todo.name)
-            if name_len < 3:
-                num = 3
-            else:
-                num = name_len
-            lines.append(num * '-')
+        return self.newline.join(self.generate_lines(todo))
 
-        for task in todo.tasks:
-            lines.append(self.generate_task(task))
+    def generate_chunks(self, todo, lines=4096):
+        """
+          yield the string of <Todo instance> by chunks of `lines` lines,
+        the same string as generate_todo() once joined, to stream it to a
+        file without building it whole::
 
-        return self.newline.join(lines)
+              todo_txt.write_chunks(generator.generate_chunks(todo))
+        """
+        items = self.generate_lines(todo)
+        newline = ''
+        while True:
+            chunk = list(islice(items, lines))
+            if not chunk:
+                return
+            yield newline + self.newline.join(chunk)
+            newline = self.newline
 
     # alias to generate_todo
     generate = generate_todo
@@ -0,0 +1,10 @@
+# lextab.py. This file automatically created by PLY (version 3.11). Don't edit!
+_tabversion   = '3.10'
+_lextokens    = set(('NAME', 'TASK'))
+_lexreflags   = 64
+_lexliterals  = ''
+_lexstateinfo = {'INITIAL': 'inclusive'}
+_lexstatere   = {'INITIAL': [('(?P<t_TASK>-\\s+(?P<done>\\[x\\])?\\s+(?P<content>.+))|(?P<t_NAME>(?P<name>[^\\n]+)\\n\\s*-{3,}\\s*\\n*)|(?P<t_newline>\\n+)', [None, ('t_TASK', 'TASK'), None, None, ('t_NAME', 'NAME'), None, ('t_newline', 'newline')])]}
+_lexstateignore = {'INITIAL': ' \t'}
+_lexstateerrorf = {'INITIAL': 't_error'}
+_lexstateeoff = {}
@@ -15,8 +15,11 @@
 see theirs docs for help.
 """
 
-import json
-import requests
+from utils import log
+
+import os
+import time
+from array import array
 
 
 class Task(object):
@@ -32,11 +35,120 @@ class Task(object):
         done      bool (optional, default: False)
     """
 
+    __slots__ = ("content", "done")
+
     def __init__(self, content, done=False):
         self.content = content
         self.done = done
 
 
+class TaskRef(object):
+    """
+      A task in a <TaskStore>, looks like a <Task>. Setting its done
+    writes to the store. A ref holds the task's index, so after a removal
+    from the store, older refs may point to another task.
+
+      attributes
+        store     <TaskStore>
+        index     int     the task's index in the store
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def content(self):
+        return self.store.content(self.index)
+
+    @property
+    def done(self):
+        return self.store.dones[self.index] == 1
+
+    @done.setter
+    def done(self, done):
+        self.store.dones[self.index] = 1 if done else 0
+
+
+class TaskStore(object):
+    """
+      Compact storage of a todo's tasks, column-wise: the contents are
+    slices of one buffer (the mapped todo.txt), given by their start and end
+    offsets, and the done states are packed in a bytearray. It presents
+    <TaskRef>s as the tasks, made on access, so no object per task is kept.
+
+      Contents of tasks added later go to a second buffer, offsets beyond
+    the first one's size point into it.
+
+      attributes
+        buffer    str     (or mmap) the contents' buffer
+        starts    array   each content's start offset
+        ends      array   each content's end offset
+        dones     bytearray   1 if the task is done, else 0
+    """
+
+    def __init__(self, buffer='', starts=None, ends=None, dones=None):
+        self.buffer = buffer
+        self.starts = array('l') if starts is None else starts
+        self.ends = array('l') if ends is None else ends
+        self.dones = bytearray() if dones is None else dones
+        self.added = bytearray()  # the second buffer
+
+    def content(self, index):
+        """return the index-th task's content"""
+        start, end = self.starts[index], self.ends[index]
+        size = len(self.buffer)
+        if start < size:
+            return self.buffer[start:end]
+        return str(self.added[start - size:end - size])
+
+    def __len__(self):
+        return len(self.dones)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("task index out of range")
+        return TaskRef(self, index)
+
+    def __iter__(self):
+        return (TaskRef(self, index) for index in xrange(len(self)))
+
+    def __delitem__(self, index):
+        del self.starts[index]
+        del self.ends[index]
+        del self.dones[index]
+
+    def append(self, task):
+        start = len(self.buffer) + len(self.added)
+        self.added.extend(task.content)
+        self.starts.append(start)
+        self.ends.append(start + len(task.content))
+        self.dones.append(1 if task.done else 0)
+
+    def remove(self, task):
+        if not isinstance(task, TaskRef) or task.store is not self:
+            raise ValueError("task not in the store")
+        del self[task.index]
+
+    def remove_all(self, indexes):
+        """remove the tasks at these indexes (sorted) in one pass"""
+        columns = []
+        for column in (self.starts, self.ends, self.dones):
+            kept = column[:0]
+            last = 0
+            for index in list(indexes) + [len(self)]:
+                kept += column[last:index]
+                last = index + 1
+            columns.append(kept)
+        self.starts, self.ends, self.dones = columns
+
+
 class Todo(object):
     """
       A todo is made up of tasks.
@@ -45,7 +157,7 @@ class Todo(object):
         name    str     (optional, default: '')todo's name, should be unique
       in all your todos in your os.
         tasks   list    (optional, default: [])tasks in this todo, each of
-      them is an instance of Task
+      them is an instance of Task. May be a <TaskStore>.
     """
 
     def __init__(self, name=None, tasks=None):
@@ -67,6 +179,10 @@ class Github(object):
         token = gh.authorize(login, password)  # authorize itself and login
         gh.login(token=token)
         gh.edit_gist()  # do things..
+
+    All the instances share one session, its connections are kept alive
+    and reused. Requests time out, and idempotent ones are retried on
+    connection errors and 5xx responses, backing off exponentially.
     """
 
     # The client_secret should not be shared in principle.
@@ -81,18 +197,84 @@ class Github(object):
     note = "Cli todo tool with readable storage."
     scopes = ["user", "gist"]
 
+    # the api's root url, set TODO_GITHUB_API to talk to a stand-in api
+    api = os.environ.get("TODO_GITHUB_API", "https://api.github.com")
+
+    # (connect, read) timeouts in seconds, TODO_HTTP_TIMEOUT overrides them
+    timeout = (3.05, 30)
+
+    pool_size = 4  # connections kept alive, per host
+    retries = 3  # retries of a failed idempotent request
+    backoff = 0.5  # seconds before the first retry, doubled for each next
+    idempotent = ("GET", "HEAD", "PUT", "PATCH", "DELETE")
+
+    _session = None  # the session shared by the instances
+
     def __init__(self):
         """
-          Init an instance of Github. New an empty session.
+          Init an instance of Github, on the process' session.
+        """
+        if Github._session is None:
+            import requests  # the http stack is only loaded by gist commands
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=self.pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            Github._session = session
+        self.session = Github._session
+        self.timeout = self.timeouts()
+
+    def timeouts(self):
+        """
+          return the (connect, read) timeouts set by TODO_HTTP_TIMEOUT, in
+        seconds: 'connect,read', or one for both. If it isn't set, or is
+        invalid, which is warned about, the default timeouts.
+        """
+        value = os.environ.get("TODO_HTTP_TIMEOUT")
+
+        if value is None:
+            return self.timeout
+        try:
+            timeout = tuple(float(seconds) for seconds in value.split(","))
+            if len(timeout) > 2 or min(timeout) <= 0:
+                raise ValueError(value)
+        except ValueError:
+            log.warning("Invalid TODO_HTTP_TIMEOUT '%s', the timeouts are "
+                        "%s,%s seconds." % ((value,) + self.timeout))
+            return self.timeout
+        return (timeout * 2)[:2]
+
+    def request(self, method, url, **kwargs):
+        """
+          Send a request on the session, with the timeouts, return the
+        response. Idempotent requests failing to connect, timing out or
+        answered 5xx are retried, the last error is raised, or the last 5xx
+        response returned.
         """
-        self.session = requests.Session()  # init a session
+        import requests
+
+        kwargs.setdefault("timeout", self.timeout)
+        retries = self.retries if method in self.idempotent else 0
+
+        for retry in xrange(retries + 1):
+            if retry:
+                time.sleep(self.backoff * 2 ** (retry - 1))
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if retry == retries:
+                    raise
+            else:
+                if response.status_code < 500 or retry == retries:
+                    return response
 
     def authorize(self, login, password):
         """
           Fetch access_token from github.com using username & password.
           return the response object
         """
-        self.session.auth = (login, password)
+        import json
         data = dict(
             client_id=self.client_id,
             client_secret=self.client_secret,
@@ -103,7 +285,9 @@ class Github(object):
 
         data_json = json.dumps(data)
         headers = {'content-type': 'application/json'}
-        return self.session.post("https://api.github.com/authorizations", data=data_json, headers=headers)
+        return self.request("POST", self.api + "/authorizations",
+                            data=data_json, headers=headers,
+                            auth=(login, password))
 
     def login(self, token):
         """
@@ -122,16 +306,20 @@ class Github(object):
 
           return response
         """
+        import json
         data = dict(
             files=files,
             description=description
         )
-        response = self.session.patch("https://api.github.com/gists/" + gist_id, data=json.dumps(data))
+        response = self.request("PATCH", self.api + "/gists/" + gist_id,
+                                data=json.dumps(data))
         return response
 
-    def get_gist(self, gist_id):
+    def get_gist(self, gist_id, etag=None):
         """
-          Fetch a single gist down, return response.
+          Fetch a single gist down, return response. Given the etag of a
+        previous response, the response is a bodyless 304 if the gist is
+        unchanged since.
 
           ::
               resp = get_gist("xxx")
@@ -140,11 +328,15 @@ class Github(object):
           To get some certain file's raw_url::
               dct["files"]["filename"]["raw_url"]
 
-          To fetch content of gist's file::
-             r = requests.get(file_raw_url)
-             print r.text
+          A file's content is in the response, unless it is truncated (it
+          is too large), then fetch it from its raw_url::
+             if dct["files"]["filename"]["truncated"]:
+                 r = gh.request("GET", file_raw_url)
+                 print r.text
         """
-        return self.session.get("https://api.github.com/gists/" + gist_id)
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.request("GET", self.api + "/gists/" + gist_id,
+                            headers=headers)
 
     def create_gist(self, files, public=False, description=""):
         """
@@ -158,12 +350,14 @@ class Github(object):
           201 code for success created.
 
         """
+        import json
         data = dict(
             files=files,
             public=public,
             description=description
         )
 
-        response = self.session.post("https://api.github.com/gists", data=json.dumps(data))
+        response = self.request("POST", self.api + "/gists",
+                                data=json.dumps(data))
 
         return response
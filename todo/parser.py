@@ -18,6 +18,9 @@
 
       parser.parse(string)  # return <Todo instance>
 
+  The default parser is the single pass <Scanner>, the ply based <Parser>
+is kept as the reference implementation and as its fallback on errors.
+
   What the todo format is? A todo is made up of name and tasks.
   A sample looks like::
 
@@ -35,9 +38,16 @@ above maps to a <Todo> instance, like a list with a name.
 
 from models import Todo
 from models import Task
+from models import TaskStore
+
+import os
+import re
+from array import array
 
-from ply import lex
-from ply import yacc
+# lexer and parser tables are generated into the package and shipped with
+# it, ply reloads them and only rebuilds when they are out of date. ply
+# itself is only imported when they are built.
+tables_dir = os.path.dirname(os.path.abspath(__file__))
 
 
 class TodoSyntaxError(Exception):
@@ -57,6 +67,7 @@ class Lexer(object):  # really a simple parser, ha?
 
       To use the lexer::
           lexer = Lexer()
+          lexer.build()  # build the ply lexer on demand
     """
 
     tokens = ("TASK", "NAME")
@@ -64,8 +75,49 @@ class Lexer(object):  # really a simple parser, ha?
     t_ignore = " \t"  # ignore spaces and tabs
 
     def __init__(self):
-        # the lexer built with instance
-        self.lexer = lex.lex(module=self)
+        self.lexer = None  # the ply lexer, built on demand
+
+    def build(self):
+        """
+          Build the ply lexer from 'todo/lextab.py' once, return it. ply
+        only checks the tables' version, so they are checked against the
+        rules here, and rebuilt if a rule changed since they were written.
+        """
+        if self.lexer is None:
+            from ply import lex
+            if self.stale():
+                self.lexer = lex.lex(module=self, errorlog=lex.NullLogger())
+                try:
+                    self.lexer.writetab("todo.lextab", tables_dir)
+                except IOError:  # an installed, read only package
+                    pass
+            else:
+                self.lexer = lex.lex(
+                    module=self, optimize=1, lextab="todo.lextab",
+                    outputdir=tables_dir, errorlog=lex.NullLogger()
+                )
+        return self.lexer
+
+    def stale(self):
+        """are the tables in 'todo/lextab.py' missing or out of the rules"""
+        try:
+            import lextab
+        except ImportError:
+            return True
+
+        try:
+            master = "|".join(regex for regex, _ in
+                              lextab._lexstatere["INITIAL"])
+            if (lextab._lextokens != set(self.tokens) or
+                    lextab._lexstateignore["INITIAL"] != self.t_ignore):
+                return True
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return True
+
+        rules = [name for name in dir(self) if name.startswith("t_") and
+                 name not in ("t_ignore", "t_error")]
+        return not all("(?P<%s>%s)" % (name, getattr(self, name).__doc__)
+                       in master for name in rules)
 
     def t_TASK(self, t):
         r'-\s+(?P<done>\[x\])?\s+(?P<content>.+)'
@@ -90,7 +142,7 @@ class Lexer(object):  # really a simple parser, ha?
 
     def test(self, data):
         # test lexer
-        self.lexer.input(data)
+        self.build().input(data)
         while True:
             tok = self.lexer.token()
             if not tok:
@@ -110,7 +162,17 @@ class Parser(object):
     tokens = Lexer.tokens
 
     def __init__(self):
-        self.parser = yacc.yacc(module=self, debug=0, write_tables=0)
+        self.parser = None  # the ply parser, built on first parse
+
+    def build(self):
+        """Build the ply parser from 'todo/parsetab.py' once, return it"""
+        if self.parser is None:
+            from ply import yacc
+            self.parser = yacc.yacc(
+                module=self, debug=0, tabmodule="todo.parsetab",
+                outputdir=tables_dir, errorlog=yacc.NullLogger()
+            )
+        return self.parser
 
     def parse(self, data):
         """
@@ -121,7 +183,9 @@ class Parser(object):
           return <Todo>
         """
         self.todo = Todo()  # reset todo
-        return self.parser.parse(data)
+        tokenizer = lexer.build()
+        tokenizer.lineno = 1
+        return self.build().parse(data, lexer=tokenizer)
 
     def p_error(self, p):
         if p:
@@ -158,5 +222,205 @@ class Parser(object):
         self.todo.tasks.append(p[1])
 
 
+class Scanner(object):
+    """
+      Single pass scanner for todo.txt, builds the same <Todo> as Parser,
+    without token objects and parser stack.
+
+      It matches the lexer's rules with one regular expression over the whole
+    string. Whitespace and newlines are skipped as a run, and the newlines
+    after a task are consumed with it. On anything that is not a task or a
+    name (or a duplicate name), the string is handed to the ply parser, so
+    syntax errors are reported exactly as the reference does.
+
+      e.g.::
+          scanner = Scanner()
+          scanner.parse(string)
+    """
+
+    pattern = re.compile(r"[%s\n]+|(?P<TASK>%s)\n*|(?P<NAME>%s)" % (
+        Lexer.t_ignore, Lexer.t_TASK.__doc__, Lexer.t_NAME.__doc__
+    ))
+
+    def bounds(self, data):
+        """return (pos, endpos) of the stripped data, without copying it"""
+        pos, endpos = 0, len(data)
+        while pos < endpos and data[pos].isspace():
+            pos += 1
+        while endpos > pos and data[endpos - 1].isspace():
+            endpos -= 1
+        return pos, endpos
+
+    def scan(self, data, pos=0, endpos=None):
+        """
+          Scan todo.txt to the columns of a todo, without building tasks.
+        data may be a str or a mmap, and is scanned from pos to endpos.
+
+          The tasks' contents are data[starts[i]:ends[i]], and dones[i] is 1
+        for done tasks. The markers column is the line offset index of the
+        tasks: the offset where a task's '[x]' mark is, or would be written
+        to check it done, by overwriting three spaces. It is -1 for task
+        lines not in the generator's layout, whose mark can't be flipped in
+        place.
+
+          parameters
+            data        str     todo format string
+          return (name, starts, ends, dones, markers), None on syntax errors
+        """
+        if endpos is None:
+            endpos = len(data)
+
+        name = ''
+        starts = array('l')
+        ends = array('l')
+        dones = bytearray()
+        markers = array('l')
+
+        for match in self.pattern.finditer(data, pos, endpos):
+            start, end = match.span()
+            if start != pos:  # characters skipped, not a token
+                return None
+            token = match.lastgroup
+            if token == "TASK":
+                done = match.start("done")  # -1 if not done
+                head, tail = match.span("content")  # head is after the mark
+                starts.append(head)
+                ends.append(tail)
+                dones.append(0 if done < 0 else 1)
+                if data.find("\n", start, head) >= 0 or data[head].isspace():
+                    markers.append(-1)
+                elif done >= 0:
+                    markers.append(done)
+                elif head - start >= 6:  # room for ' [x] '
+                    markers.append(start + 2)
+                else:
+                    markers.append(-1)
+            elif token == "NAME":
+                if name:  # duplicate definition
+                    return None
+                name = match.group("name")
+            pos = end
+
+        if pos != endpos:
+            return None
+        return name, starts, ends, dones, markers
+
+    def build(self, data, columns):
+        """
+          Build <Todo instance> from data and its columns returned by
+        scan(), one <Task> object per task.
+        """
+        name, starts, ends, dones = columns[:4]
+        tasks = [Task(data[starts[i]:ends[i]], dones[i] == 1)
+                 for i in xrange(len(dones))]
+        return Todo(name, tasks)
+
+    def store(self, data, columns):
+        """
+          Build <Todo instance> from data and its columns returned by
+        scan(), its tasks in a compact <TaskStore> over data.
+        """
+        name, starts, ends, dones = columns[:4]
+        return Todo(name, TaskStore(data, starts, ends, dones))
+
+    def parse(self, data):
+        """
+          Parse todo.txt to todo instance.
+
+          parameters
+            data        str     todo format string
+          return <Todo>
+        """
+        columns = self.scan(data)
+        if columns is None:
+            return ply_parser.parse(data)  # raises the syntax error
+        return self.build(data, columns)
+
+    def cut(self, data):
+        """
+          Return the offset of the last line in data the scan can be cut
+        before, 0 if there is none. No token crosses such a line, whatever
+        data follows: the line starts with a task's '- ' or a name's first
+        character, and the line above ends with a character no whitespace
+        run can continue from.
+        """
+        end = len(data) - 2  # the two characters of the line's start
+
+        while True:
+            newline = data.rfind("\n", 0, end)
+            if newline < 1:
+                return 0
+            last = data[newline - 1]
+            first, second = data[newline + 1:newline + 3]
+            if (not last.isspace() and last not in "-]" and
+                    not first.isspace() and
+                    (first != "-" or second in " \t")):
+                return newline + 1
+            end = newline
+
+    def iter_tasks(self, fileobj, size=1 << 16):
+        """
+          Scan todo.txt from a file object read in chunks of size bytes,
+        yield its name (str) and tasks (<Task>) in order, as they come.
+        The todo's name is the first item unless it is defined after tasks,
+        or missing.
+
+          Each chunk is scanned up to its last line that can be cut(), so
+        the tasks are the same as parse() returns from the stripped file.
+        On syntax errors the whole file is read again and handed to the ply
+        parser, which raises the error.
+
+          e.g.::
+              for item in scanner.iter_tasks(open("todo.txt")):
+                  print item
+        """
+        named = False
+        buf = ''
+        pos = 0
+        eof = False
+
+        while not eof:
+            chunk = fileobj.read(size)
+            eof = not chunk
+
+            if eof:
+                data, buf = buf.rstrip(), ''
+            else:
+                if not buf:
+                    chunk = chunk.lstrip()  # the file is stripped as a whole
+                buf += chunk
+                cut = self.cut(buf)
+                if not cut:
+                    continue
+                data, buf = buf[:cut], buf[cut:]
+
+            pos = 0
+
+            for match in self.pattern.finditer(data):
+                start, end = match.span()
+                if start != pos:  # characters skipped, not a token
+                    break
+                token = match.lastgroup
+                if token == "TASK":
+                    done, content = match.group("done", "content")
+                    yield Task(content, True if done else False)
+                elif token == "NAME":
+                    if named:  # duplicate definition
+                        break
+                    named = True
+                    yield match.group("name")
+                pos = end
+
+            if pos != len(data):
+                break
+        else:
+            return
+
+        fileobj.seek(0)
+        ply_parser.parse(fileobj.read().strip())  # raises the syntax error
+
+
 lexer = Lexer()
-parser = Parser()  # build parser
+ply_parser = Parser()  # tables are loaded on the first parse
+scanner = Scanner()
+parser = scanner  # the default parser
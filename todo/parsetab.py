@@ -0,0 +1,36 @@
+
+# parsetab.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'NAME TASKstart : translation_unit\n        translation_unit : translation\n                         | translation_unit translation\n                         |\n        \n        translation : NAME\n        \n        translation : TASK\n        '
+    
+_lr_action_items = {'TASK':([0,2,3,4,5,6,],[3,-2,-6,-5,3,-3,]),'NAME':([0,2,3,4,5,6,],[4,-2,-6,-5,4,-3,]),'$end':([0,1,2,3,4,5,6,],[-4,0,-2,-6,-5,-1,-3,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'start':([0,],[1,]),'translation':([0,5,],[2,6,]),'translation_unit':([0,],[5,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> start","S'",1,None,None,None),
+  ('start -> translation_unit','start',1,'p_start','parser.py',161),
+  ('translation_unit -> translation','translation_unit',1,'p_translation_unit','parser.py',166),
+  ('translation_unit -> translation_unit translation','translation_unit',2,'p_translation_unit','parser.py',167),
+  ('translation_unit -> <empty>','translation_unit',0,'p_translation_unit','parser.py',168),
+  ('translation -> NAME','translation',1,'p_translation_name','parser.py',174),
+  ('translation -> TASK','translation',1,'p_translation_task','parser.py',182),
+]
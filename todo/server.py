@@ -0,0 +1,268 @@
+# coding=utf8
+# _____      _________
+# __  /____________  /_____
+# _  __/  __ \  __  /_  __ \
+# / /_ / /_/ / /_/ / / /_/ /
+# \__/ \____/\__,_/  \____/
+#
+# Todo application in the command line, with readable storage.
+# Authors: https://github.com/secreek
+# Home: https://github.com/secreek/todo
+# Email: nz2324@126.com
+# License: MIT
+
+"""
+  Resident todo server over a unix socket, and its client::
+
+      todo serve  # in a shell of its own, or in the background
+
+  While it runs, `todo` commands send their arguments to the server, which
+runs them with the todos kept loaded, and prints its output. Without a
+server, `todo` runs them itself.
+"""
+
+import os
+import sys
+import marshal
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+socket_path = os.path.join(os.path.expanduser("~"), ".todo", "todo.sock")
+
+
+class Client(object):
+    """
+      Client of the todo server, a command is sent as (cwd, args, stdin,
+    colors), colors if the client's output is colored, and the server
+    replies (status, output), both marshaled, each side shutting down its
+    writing to end its message. The output is paged as <Output> does.
+
+      attributes
+        local       tuple   commands always run in process: the server
+                            can't ask for input, nor serve itself
+      methods
+        run         run a command through the server
+    """
+
+    local = ("serve", "push", "pull", "sync", "gist_id", "workspace")
+
+    def run(self, args):
+        """
+          Run the command of args (sys.argv[1:]) through the server, write
+        its output and return its exit status. Return None if there's no
+        server running or the command is a local one.
+        """
+        if (args and args[0] in self.local) or not os.path.exists(socket_path):
+            return None
+
+        import socket  # only paid while a server may be running
+
+        stdin = None
+        if args[:1] == ["batch"] and args[1:] in ([], ["-"]):
+            stdin = sys.stdin.read()
+        from utils import color
+        request = marshal.dumps((os.getcwd(), args, stdin, color.enabled))
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+        except socket.error:  # a stale socket, the server is gone
+            sock.close()
+            if stdin is not None:
+                sys.stdin = StringIO(stdin)
+            return None
+
+        try:
+            sock.sendall(request)
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = sock.recv(1 << 16)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        finally:
+            sock.close()
+
+        status, output = marshal.loads("".join(chunks))
+        from utils import Output
+        writer = Output(page=bool(output))
+        writer.write(output)
+        writer.close()
+        return status
+
+
+class Server(object):
+    """
+      The todo server: runs commands sent by clients one at a time, with
+    an <App instance> kept per todo.txt, so its todo stays loaded between
+    commands.
+
+      Every second, and before each command, the todo.txts are stat'ed:
+    a todo edited by hand (or by a `todo` run without the server) is let
+    go and loaded again.
+
+      methods
+        serve       serve until interrupted
+        execute     run a command, return (status, output)
+    """
+
+    def __init__(self):
+        self.apps = {}  # todo.txt's absolute path => <App instance>
+
+    def app(self):
+        """return the <App instance> for the todo.txt of the cwd"""
+        from app import App
+        from app import TodoTxt
+
+        path = TodoTxt().path  # absolute
+        app = self.apps.get(path)
+
+        if app is None:
+            app = self.apps[path] = App(path)
+        else:
+            app.refresh()
+        return app
+
+    def watch(self):
+        """
+          refresh the apps, and load their todos again. Journals are
+        compacted while idle, so todo.txts are soon readable.
+        """
+        for path, app in self.apps.items():
+            app.refresh()
+            try:
+                if app._todo is None:
+                    app.todo
+                if app.todo_journal.count:
+                    app.compact()
+                    app.todo
+            except Exception:  # syntax errors, todo.txt removed..
+                del self.apps[path]
+
+    def execute(self, cwd, args, stdin=None, colors=False):
+        """
+          run the command of args in cwd, return (status, output), colored
+        if colors
+        """
+        from utils import color
+
+        stdout, argv, input = sys.stdout, sys.argv, sys.stdin
+        enabled, color.enabled = color.enabled, colors
+        sys.stdout = output = StringIO()
+        sys.argv = ["todo"] + list(args)
+        if stdin is not None:
+            sys.stdin = StringIO(stdin)
+        status = 0
+
+        try:
+            os.chdir(cwd)
+            app = self.app()
+            app.run()
+        except SystemExit as exit:
+            if exit.code is None or isinstance(exit.code, int):
+                status = exit.code or 0
+            else:  # a message, like docopt's usage
+                print exit.code
+                status = 1
+        except Exception:
+            import traceback
+            traceback.print_exc(file=output)
+            status = 1
+            self.apps.clear()  # the apps' state is unknown
+        finally:
+            sys.stdout, sys.argv, sys.stdin = stdout, argv, input
+            color.enabled = enabled
+
+        return status, output.getvalue()
+
+    def serve(self):
+        """listen on the socket and serve until interrupted"""
+        import signal
+        import socket
+        import SocketServer
+
+        server = self
+
+        class Handler(SocketServer.StreamRequestHandler):
+
+            def handle(self):
+                request = marshal.loads(self.rfile.read())
+                response = server.execute(*request)
+                self.wfile.write(marshal.dumps(response))
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except socket.error:
+            if os.path.exists(socket_path):  # stale
+                os.remove(socket_path)
+        else:
+            probe.close()
+            from utils import log
+            log.error("A todo server is running already.")
+
+        todo_dir = os.path.dirname(socket_path)
+        if not os.path.exists(todo_dir):
+            os.makedirs(todo_dir)
+
+        umask = os.umask(0o077)  # the socket is the user's only
+        try:
+            unix_server = SocketServer.UnixStreamServer(socket_path, Handler)
+        finally:
+            os.umask(umask)
+
+        unix_server.timeout = 1
+        unix_server.handle_timeout = self.watch
+
+        print "Serving todo on %s, ^C to stop." % socket_path
+        self.app()
+        self.watch()  # load the todo of the cwd at once
+
+        def stop(signum, frame):
+            raise KeyboardInterrupt  # not caught by execute()
+
+        signal.signal(signal.SIGTERM, stop)
+
+        try:
+            while True:
+                unix_server.handle_request()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            unix_server.server_close()
+            os.remove(socket_path)
+
+
+client = Client()
+
+
+def main():
+    """
+      The `todo` command: run through the server if one runs, else in
+    process. Only this module and utils are imported to talk to the server.
+    Traced if TODO_TRACE is set, profiled if TODO_PROFILE is, see tracing.
+    """
+    if os.environ.get("TODO_TRACE") or os.environ.get("TODO_PROFILE"):
+        import tracing
+        tracing.run(command)
+    else:
+        command()
+
+
+def command():
+    """run the command of sys.argv, see main"""
+    status = client.run(sys.argv[1:])
+
+    if status is None:
+        from app import main
+        main()
+    else:
+        sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+# coding=utf8
+# _____      _________
+# __  /____________  /_____
+# _  __/  __ \  __  /_  __ \
+# / /_ / /_/ / /_/ / / /_/ /
+# \__/ \____/\__,_/  \____/
+#
+# Todo application in the command line, with readable storage.
+# Authors: https://github.com/secreek
+# Home: https://github.com/secreek/todo
+# Email: nz2324@126.com
+# License: MIT
+
+"""
+  Sync of many todo lists with their gists at once::
+
+      todo sync push
+      todo sync pull
+
+  The lists are set in '~/.todo/sync', a line per todo.txt, or glob of
+todo.txts::
+
+      # <gist_id> <todo.txt's path or glob> [<file name>]
+      1234abcd ~/projects/*/todo.txt
+      5678ef90 ~/todo.txt Personal
+
+  A list's file in its gist is named the file name given, else the todo's
+name, as `todo push` names it. The gists are synced concurrently, on the
+pool of connections of <Github instance>: each gist is pushed in one
+request with all its lists changed, or fetched once (conditionally, see
+PulledGist) for all its lists. Lists are reported as they are done, and
+one failing doesn't stop the others.
+"""
+
+import os
+import glob
+import Queue
+import threading
+
+from app import App
+from app import Gist
+from app import GistError
+from app import PulledGist
+from app import GithubToken
+from app import PushedHashes
+from models import Github
+from utils import log
+from utils import colored
+
+
+class SyncConfig(Gist):
+    """
+      The lists to sync, in '~/.todo/sync'.
+
+      methods
+        lists       return the lists, globs expanded
+    """
+
+    def __init__(self):
+        super(SyncConfig, self).__init__()
+        self.name = "sync"
+        self.path = os.path.join(self.todo_dir, self.name)
+        self.read()
+
+    def lists(self):
+        """
+          return [(todo.txt's path, gist_id, file name or None)] in order,
+        a todo.txt once. Fatal error on an invalid line.
+        """
+        lists = []
+        seen = set()
+
+        for lineno, line in enumerate((self.content or "").splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            parts = line.split(None, 2)
+            if len(parts) < 2:
+                log.error("%s, line %d: expected '<gist_id> <path> "
+                          "[<file name>]'." % (self.path, lineno))
+
+            gist_id, pattern = parts[:2]
+            name = parts[2] if len(parts) > 2 else None
+            pattern = os.path.join(self.home, os.path.expanduser(pattern))
+
+            if glob.has_magic(pattern):
+                paths = sorted(glob.glob(pattern))
+            else:
+                paths = [pattern]
+
+            for path in map(os.path.realpath, paths):
+                if path not in seen:
+                    seen.add(path)
+                    lists.append((path, gist_id, name))
+        return lists
+
+
+def describe(error):
+    """an error's message, to report"""
+    if isinstance(error, SystemExit):  # log.error printed it
+        return "see above"
+    return str(error) or type(error).__name__
+
+
+class Sync(object):
+    """
+      Sync of the lists set in '~/.todo/sync' with their gists.
+
+      attributes
+        workers     int     gists synced at once, a pooled connection each
+      methods
+        push        push the lists changed to their gists
+        pull        pull the lists from their gists
+    """
+
+    workers = Github.pool_size
+
+    def __init__(self):
+        self.lists = SyncConfig().lists()
+        self.github = Github()
+        self.pushed = PushedHashes()
+        self.mutex = threading.Lock()  # around self.pushed's changes
+
+        if not self.lists:
+            log.error("No lists to sync, set them in %s, a line each: "
+                      "<gist_id> <todo.txt's path or glob> [<file name>]"
+                      % SyncConfig().path)
+
+    def gists(self):
+        """return the lists by gist, [(gist_id, [(path, name)])] in order"""
+        gists = {}
+        order = []
+        for path, gist_id, name in self.lists:
+            if gist_id not in gists:
+                gists[gist_id] = []
+                order.append(gist_id)
+            gists[gist_id].append((path, name))
+        return [(gist_id, gists[gist_id]) for gist_id in order]
+
+    def run(self, sync_gist, verb):
+        """
+          Run sync_gist(gist_id, lists) for each gist, by the workers. It
+        returns [(path, name, status, error)] for its lists, a status None
+        if the list failed. The lists are reported once done, the total at
+        the end, fatal error if a list failed.
+        """
+        gists = self.gists()
+        jobs = Queue.Queue()
+        results = Queue.Queue()
+
+        for gist in gists:
+            jobs.put(gist)
+
+        def work():
+            while True:
+                try:
+                    gist_id, lists = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    done = sync_gist(gist_id, lists)
+                except (Exception, SystemExit) as error:  # all its lists
+                    done = [(path, name, None, describe(error))
+                            for path, name in lists]
+                for result in done:
+                    results.put((gist_id,) + result)
+
+        for _ in xrange(min(self.workers, len(gists))):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+
+        counts = {}
+        total = len(self.lists)
+
+        for count in xrange(1, total + 1):
+            # a timeout, else the wait can't be interrupted
+            gist_id, path, name, status, error = results.get(True, 1 << 30)
+            counts[status] = counts.get(status, 0) + 1
+
+            if status is None:
+                state = colored("failed", "red")
+            elif status == verb:
+                state = colored(status, "green")
+            else:
+                state = colored(status, "gray")
+
+            line = "[%*d/%d] %s %s => %s/%s" % (
+                len(str(total)), count, total, state,
+                path.replace(os.path.expanduser("~"), "~", 1), gist_id,
+                name or "?")
+            if error:
+                line += colored(": " + error, "red")
+            print line
+
+        summary = ", ".join("%d %s" % (number, status or "failed")
+                            for status, number in sorted(counts.items()))
+        summary = "Synced %d lists with %d gists: %s." % (
+            total, len(gists), summary)
+
+        if None in counts:
+            log.error(summary)
+        log.ok(summary)
+
+    def push(self, force=False):
+        """
+          Push the lists changed since last pushed (or all, if forced) to
+        their gists. The lists are read first, the token is only needed if
+        one of them is pushed.
+        """
+        changes = dict((gist_id, self.changes(gist_id, lists, force))
+                       for gist_id, lists in self.gists())
+
+        if any(files for results, files in changes.values()):
+            self.github.login(GithubToken().get())
+
+        def push_gist(gist_id, lists):
+            results, files = changes[gist_id]
+
+            if files:
+                response = self.github.edit_gist(gist_id, files=dict(
+                    (name, {"content": content})
+                    for name, (path, content) in files.items()))
+
+                for name, (path, content) in sorted(files.items()):
+                    if response.status_code == 200:
+                        with self.mutex:
+                            self.pushed.set(gist_id, name, content)
+                        results.append((path, name, "pushed", None))
+                    else:
+                        results.append((path, name, None, "Push failed. %d"
+                                        % response.status_code))
+            return results
+
+        self.run(push_gist, "pushed")
+
+    def changes(self, gist_id, lists, force):
+        """
+          return (results, files) of a gist's lists to push: the results
+        (see run) of the lists failed or unchanged since last pushed, and
+        {file name: (path, content)} of the others, or of all if forced.
+        """
+        results = []
+        files = {}
+
+        for path, name in lists:
+            try:
+                if not os.path.exists(path):
+                    raise IOError("No such file")
+                app = App(path)
+                app.compact()  # push todo.txt up to date
+                name = name or app.todo.name or "Todo"
+                content = app.todo_txt.read()
+            except (Exception, SystemExit) as error:
+                results.append((path, name, None, describe(error)))
+                continue
+
+            if name in files:
+                error = "%s pushed to it already" % files[name][0]
+                results.append((path, name, None, error))
+            elif (not force and self.pushed.get(gist_id, name) ==
+                    self.pushed.hash(content)):
+                results.append((path, name, "unchanged", None))
+            else:
+                files[name] = (path, content)
+        return results, files
+
+    def pull(self):
+        """pull the lists from their gists"""
+        token = GithubToken().content
+        if token:  # not needed to pull public gists
+            self.github.login(token)
+
+        def pull_gist(gist_id, lists):
+            results = []
+            pulls = []
+
+            for path, name in lists:
+                try:
+                    if not os.path.exists(path) and name:
+                        open(path, "a").close()  # a new list
+                    app = App(path)
+                    name = name or app.todo.name
+                    if not name:
+                        raise GistError("No name to pull, set its file name")
+                except (Exception, SystemExit) as error:
+                    results.append((path, name, None, describe(error)))
+                    continue
+                pulls.append((path, name, app))
+
+            try:
+                u_contents = PulledGist(gist_id).fetch(
+                    self.github, [name.decode("utf8") for _, name, _ in pulls])
+            except Exception as error:
+                return results + [(path, name, None, describe(error))
+                                  for path, name, app in pulls]
+
+            for (path, name, app), u_content in zip(pulls, u_contents):
+                if u_content is None:
+                    results.append((path, name, None, "Not in gist"))
+                    continue
+
+                content = u_content.encode("utf8").strip()
+                try:
+                    replaced = app.replace_todo(content)
+                except (Exception, SystemExit) as error:
+                    results.append((path, name, None, describe(error)))
+                    continue
+
+                with self.mutex:
+                    self.pushed.set(gist_id, name, content)
+                results.append((path, name, "pulled" if replaced else
+                                "up to date", None))
+            return results
+
+        self.run(pull_gist, "pulled")
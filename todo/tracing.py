@@ -0,0 +1,226 @@
+# coding=utf8
+# _____      _________
+# __  /____________  /_____
+# _  __/  __ \  __  /_  __ \
+# / /_ / /_/ / /_/ / / /_/ /
+# \__/ \____/\__,_/  \____/
+#
+# Todo application in the command line, with readable storage.
+# Authors: https://github.com/secreek
+# Home: https://github.com/secreek/todo
+# Email: nz2324@126.com
+# License: MIT
+
+"""
+  Opt-in tracing and profiling of a todo command::
+
+      TODO_TRACE=1 todo search milk         # a JSON summary to stderr
+      TODO_PROFILE=todo.prof todo --all     # cProfile's stats to a file
+      TODO_PROFILE=- todo --all             # the top functions to stderr
+
+  The trace reports the command's phases: importing the app, loading the
+todo, reading, parsing, caching, journaling, generating, writing, output,
+waiting for the lock, and the requests to Github, each request on its own.
+A phase has its calls, wall time, and growth of the max resident set size
+in KB: Python 2 has no tracemalloc, so the memory of a phase is how much
+higher it took the peak. Phases are inclusive (load includes parse), and a
+phase's calls nested in its own are counted once.
+
+  The phases' functions are wrapped when the tracer is installed, this
+module is imported only then, so commands not traced run as they are.
+"""
+
+import os
+import sys
+import time
+import atexit
+import resource
+from functools import wraps
+
+# (module, class, method, phase) of the functions traced
+traced = [
+    ("app", "App", "load", "load"),
+    ("app", "File", "read", "read"),
+    ("app", "File", "map", "read"),
+    ("app", "File", "write", "write"),
+    ("app", "File", "write_chunks", "write"),
+    ("app", "File", "replace", "write"),
+    ("app", "File", "append", "write"),
+    ("app", "File", "patch", "write"),
+    ("app", "TodoCache", "load", "cache"),
+    ("app", "TodoCache", "save", "cache"),
+    ("app", "TodoCache", "check", "cache"),
+    ("app", "TodoIndex", "search", "index"),
+    ("app", "TodoJournal", "read", "journal"),
+    ("app", "TodoJournal", "append", "journal"),
+    ("app", "TodoLock", "acquire", "lock"),
+    ("parser", "Scanner", "scan", "parse"),
+    ("parser", "Scanner", "parse", "parse"),
+    ("parser", "Scanner", "iter_tasks", "parse"),
+    ("parser", "Parser", "parse", "parse"),
+    ("generator", "Generator", "generate_todo", "generate"),
+    ("generator", "Generator", "generate", "generate"),
+    ("generator", "Generator", "generate_chunks", "generate"),
+    ("utils", "Output", "write", "output"),
+    ("utils", "Output", "close", "output"),
+    ("server", "Client", "run", "server"),
+]
+
+
+def peak():
+    """max resident set size of the process, in KB (bytes on OS X)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Tracer(object):
+    """
+      Records the phases of a command, reports them at exit.
+
+      attributes
+        phases      dict    {phase: [calls, seconds, KB]}
+        requests    list    the Github requests, dicts of their method,
+                            url, status (or error), seconds and bytes
+      methods
+        install     wrap the phases' functions, report at exit
+        phase       return a function wrapped to record a phase
+        report      write the summary to stderr, as JSON
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.phases = {}
+        self.requests = []
+        self.active = set()  # the phases being run
+
+    def record(self, phase, seconds, kb, calls=1):
+        """add a run of a phase"""
+        totals = self.phases.setdefault(phase, [0, 0.0, 0])
+        totals[0] += calls
+        totals[1] += seconds
+        totals[2] += kb
+
+    def phase(self, func, phase):
+        """return func wrapped to record its runs as the phase"""
+        if func.func_code.co_flags & 0x20:  # a generator function
+            return self.phase_items(func, phase)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if phase in self.active:  # nested, the outer run records it
+                return func(*args, **kwargs)
+            self.active.add(phase)
+            kb, start = peak(), time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(phase, time.time() - start, peak() - kb)
+                self.active.discard(phase)
+        return wrapper
+
+    def phase_items(self, func, phase):
+        """phase() of a generator function: its items' times add up"""
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            items = func(*args, **kwargs)
+            kb, seconds = peak(), 0.0
+            try:
+                while True:
+                    start = time.time()
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                    finally:
+                        seconds += time.time() - start
+                    yield item
+            finally:
+                items.close()
+                self.record(phase, seconds, peak() - kb)
+        return wrapper
+
+    def request(self, func):
+        """return Github.request wrapped to record each request"""
+
+        @wraps(func)
+        def wrapper(github, method, url, **kwargs):
+            entry = {"method": method, "url": url, "status": None,
+                     "bytes": None}
+            kb, start = peak(), time.time()
+            try:
+                response = func(github, method, url, **kwargs)
+                entry["status"] = response.status_code
+                entry["bytes"] = len(response.content)
+                return response
+            except Exception as error:
+                entry["status"] = type(error).__name__
+                raise
+            finally:
+                entry["seconds"] = round(time.time() - start, 6)
+                self.requests.append(entry)
+                self.record("http", entry["seconds"], peak() - kb)
+        return wrapper
+
+    def install(self):
+        """import the app, as the import phase, and wrap the phases"""
+        kb, start = peak(), time.time()
+        import app  # the app's modules, loaded once here
+        self.record("import", time.time() - start, peak() - kb)
+
+        for module, cls, method, phase in traced:
+            cls = getattr(__import__(module, globals()), cls)
+            setattr(cls, method, self.phase(cls.__dict__[method], phase))
+
+        from models import Github
+        Github.request = self.request(Github.__dict__["request"])
+
+        atexit.register(self.report)
+
+    def report(self):
+        """write the summary of the command to stderr, as JSON"""
+        import json
+
+        summary = {
+            "command": sys.argv[1:],
+            "seconds": round(time.time() - self.start, 6),
+            "max_rss_kb": peak(),
+            "phases": dict((phase, {"calls": calls,
+                                    "seconds": round(seconds, 6),
+                                    "rss_kb": kb})
+                           for phase, (calls, seconds, kb)
+                           in self.phases.items()),
+            "requests": self.requests,
+        }
+        sys.stderr.write(json.dumps(summary, indent=2, sort_keys=True,
+                                    separators=(",", ": ")) + "\n")
+
+
+def profile(func, path):
+    """
+      run func under cProfile, dump its stats to path, or print the top
+    functions by cumulative time to stderr if path is '-'
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(func)
+    finally:
+        if path == "-":
+            import pstats
+            stats = pstats.Stats(profiler, stream=sys.stderr)
+            stats.sort_stats("cumulative").print_stats(30)
+        else:
+            profiler.dump_stats(path)
+
+
+def run(command):
+    """run command, traced if TODO_TRACE is set, profiled if TODO_PROFILE"""
+    if os.environ.get("TODO_TRACE"):
+        Tracer().install()
+
+    path = os.environ.get("TODO_PROFILE")
+    if path:
+        profile(command, path)
+    else:
+        command()
@@ -13,12 +13,20 @@
 
 """Utils used in cli app"""
 
+import os
 import sys
-from getpass import getpass
+import errno
+from itertools import islice
 
 
 class Color(object):
-    """Util to print 256 color(xterm-256)"""
+    """
+      Util to print 256 color(xterm-256). Colors are enabled if stdout is
+    a terminal, unless TODO_COLOR is 'always' or 'never'.
+
+      attributes
+        enabled     bool    if strings are colored, else they are left as is
+    """
 
     # common colors
     colors = {
@@ -38,17 +46,110 @@ class Color(object):
 
     suffix = '\x1b[0m'
 
-    def colored(self, string, color=None):
+    def __init__(self):
+        setting = os.environ.get("TODO_COLOR")
+        if setting in ("always", "never"):
+            self.enabled = setting == "always"
+        else:
+            self.enabled = isatty(sys.stdout)
+
+    def codes(self, color=None):
         """
-          ::
-              colored("string", "red")  # return str
+          return the (start, end) escape codes around a string colored, to
+        format many strings alike at once. ('', '') if disabled.
         """
+        if not self.enabled:
+            return '', ''
         if color not in self.colors:
             color = 'white'
-        value = self.colors[color]
-        return (self.prefix + '%dm%s' + self.suffix) % (value, string)
+        return self.prefix + '%dm' % self.colors[color], self.suffix
 
-colored = Color().colored
+    def colored(self, string, color=None):
+        """
+          ::
+              colored("string", "red")  # return str
+        """
+        start, end = self.codes(color)
+        return start + string + end
+
+
+def isatty(stream):
+    """if stream is a terminal, False if it can't tell"""
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):  # no isatty, closed
+        return False
+
+color = Color()
+colored = color.colored
+
+
+class Output(object):
+    """
+      Buffered output of many lines, written by chunks of `chunk` lines,
+    each with a single write. Optionally piped to the pager set in
+    TODO_PAGER (e.g. 'less -FRX'), if stdout is a terminal. Output closed
+    by the reader, like `todo --all | head`, ends the command quietly.
+
+      attributes
+        chunk       int     lines joined per write
+      methods
+        write       write a string
+        writelines  write the lines of an iterable, by chunks
+        close       flush, wait for the pager if any
+    """
+
+    chunk = 4096
+
+    def __init__(self, page=False):
+        self.stream = sys.stdout
+        self.pager = None
+
+        command = os.environ.get("TODO_PAGER")
+        if page and command and isatty(sys.stdout):
+            import subprocess  # only paid if paging
+            self.pager = subprocess.Popen(command, shell=True,
+                                          stdin=subprocess.PIPE)
+            self.stream = self.pager.stdin
+
+    def write(self, string):
+        """write a string"""
+        try:
+            self.stream.write(string)
+        except IOError as error:
+            self.closed(error)
+
+    def writelines(self, lines):
+        """write the lines (ending with newlines) of an iterable"""
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, self.chunk))
+            if not chunk:
+                break
+            self.write("".join(chunk))
+
+    def close(self):
+        """flush the output, and wait for the pager to quit if any"""
+        try:
+            if self.pager is not None:
+                self.stream.close()
+            else:
+                self.stream.flush()
+        except IOError as error:
+            self.closed(error)
+        finally:
+            if self.pager is not None:
+                self.pager.wait()
+
+    def closed(self, error):
+        """end the command quietly if the reader closed the output"""
+        if error.errno != errno.EPIPE:
+            raise error
+        if self.pager is not None:
+            self.pager.wait()
+        else:  # what is left buffered in stdout is flushed at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), self.stream.fileno())
+        sys.exit(0)
 
 
 class AskInput(object):
@@ -63,6 +164,7 @@ class AskInput(object):
 
     def password(self, message):
         """Ask user to input password without echo back"""
+        from getpass import getpass
         passwd = ''
         while not passwd:
             passwd = getpass(message)
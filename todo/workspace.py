@@ -0,0 +1,148 @@
+# coding=utf8
+# _____      _________
+# __  /____________  /_____
+# _  __/  __ \  __  /_  __ \
+# / /_ / /_/ / /_/ / / /_/ /
+# \__/ \____/\__,_/  \____/
+#
+# Todo application in the command line, with readable storage.
+# Authors: https://github.com/secreek
+# Home: https://github.com/secreek/todo
+# Email: nz2324@126.com
+# License: MIT
+
+"""
+  Workspace of the todo lists in a directory tree::
+
+      todo workspace --dir ~/src           # undone tasks of all the lists
+      todo workspace search bug --dir ~/src
+
+  Every 'todo.txt' under the directory is a list, hidden directories are
+skipped. The lists are loaded in parallel by a pool of processes, each
+through its cache (and its search index), and their tasks printed in the
+lists' order, each prefixed with its list's name.
+"""
+
+import os
+
+from app import App
+from utils import log
+from utils import colored
+from utils import Output
+
+
+def load_list(job):
+    """
+      Load a list, in a worker: job is (path, strs, all). Return (path,
+    name, tasks, error), tasks [(id, content, done)] the tasks having all
+    the strs if any, else all the tasks if all, else the undone ones.
+    """
+    path, strs, all = job
+
+    try:
+        app = App(path)
+        tasks = app.todo.tasks
+
+        if strs:
+            indexes = app.todo_index.search(tasks, strs, app._todo_stat)
+        else:
+            indexes = [index for index, task in enumerate(tasks)
+                       if all or not task.done]
+
+        return path, app.todo.name, [
+            (index + 1, tasks[index].content, tasks[index].done)
+            for index in indexes], None
+    except SystemExit:  # log.error printed it, a journal unreadable..
+        return path, None, [], "see above"
+    except Exception as error:  # syntax errors, a list removed..
+        return path, None, [], str(error) or type(error).__name__
+
+
+def load_lists(jobs):
+    """load a chunk of lists, in a worker, see load_list"""
+    return map(load_list, jobs)
+
+
+class Workspace(object):
+    """
+      The todo lists under a directory.
+
+      attributes
+        root        str     the directory
+        processes   int     the pool's size, by default the cpus' count
+        serial      int     up to this many lists, they are loaded in
+                            process, starting a pool costs more
+      methods
+        find        return the todo.txts' paths
+        load        yield the lists loaded
+        ls          print the lists' tasks, prefixed with their names
+    """
+
+    serial = 16
+
+    def __init__(self, root, processes=None):
+        self.root = os.path.abspath(root)
+        self.processes = processes
+
+    def find(self):
+        """return the paths of the todo.txts under root, sorted"""
+        paths = []
+
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = sorted(name for name in dirnames
+                                 if not name.startswith("."))
+            if "todo.txt" in filenames:
+                paths.append(os.path.join(dirpath, "todo.txt"))
+        return paths
+
+    def load(self, strs=None, all=False):
+        """
+          yield the lists loaded by load_list() in order, by a pool of
+        processes if there are many.
+        """
+        jobs = [(path, strs, all) for path in self.find()]
+
+        if len(jobs) <= self.serial or self.processes == 1:
+            for job in jobs:
+                yield load_list(job)
+            return
+
+        import multiprocessing
+
+        processes = self.processes or multiprocessing.cpu_count()
+        size = max(1, len(jobs) // (processes * 8))
+        chunks = [jobs[start:start + size]
+                  for start in xrange(0, len(jobs), size)]
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.imap(load_lists, chunks)
+            for _ in chunks:
+                # a timeout, else the wait can't be interrupted
+                for result in results.next(1 << 30):
+                    yield result
+            pool.close()
+        finally:
+            pool.terminate()
+
+    def ls(self, strs=None, all=False):
+        """
+          Print the tasks of the lists having all the strs if any, else all
+        the tasks if all, else the undone ones, each prefixed with its
+        list's name, or its path if it has none.
+        """
+        output = Output(page=True)
+
+        for path, name, tasks, error in self.load(strs, all):
+            if error is not None:
+                log.warning("%s: %s" % (path, error))
+                continue
+            if not tasks:
+                continue
+            if not name:
+                name = os.path.relpath(os.path.dirname(path), self.root)
+            templates = App(path).task_templates(
+                prefix=colored(name, "orange") + " ", suffix="\n")
+            output.writelines(templates[done] % (id, content)
+                              for id, content, done in tasks)
+        output.close()